@@ -0,0 +1,448 @@
+""" Direct avatar output over one persistent WebSocket (VTube Studio or veadotube APIs).
+
+Standard library only. The key presses from the "keys" config section remain the
+fallback whenever the socket is down or an action has no avatar state mapped.
+
+    python avatar_ws.py mock --port 8001      # local mock avatar app, prints what it receives
+    python avatar_ws.py demo                  # mock + backend round trip, fully offline
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import socket
+import struct
+import select
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+VTS_TOKEN_FILE = "vtube_studio_token.txt"
+
+# --- WEBSOCKET FRAMING ---
+def _xor_mask(data, key):
+    n = len(data)
+    if not n:
+        return data
+    k = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(k, "big")).to_bytes(n, "big")
+
+def _recv_exact(sock, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        buf += chunk
+    return buf
+
+def write_frame(sock, opcode, payload, mask):
+    header = bytes([0x80 | opcode])
+    n = len(payload)
+    bit = 0x80 if mask else 0
+    if n < 126:
+        header += bytes([bit | n])
+    elif n < 1 << 16:
+        header += bytes([bit | 126]) + struct.pack(">H", n)
+    else:
+        header += bytes([bit | 127]) + struct.pack(">Q", n)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = _xor_mask(payload, key)
+    sock.sendall(header + payload)
+
+def read_frame(sock):
+    """ Returns (fin, opcode, payload), unmasking client frames """
+    b0, b1 = _recv_exact(sock, 2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack(">H", _recv_exact(sock, 2))[0]
+    elif n == 127:
+        n = struct.unpack(">Q", _recv_exact(sock, 8))[0]
+    key = _recv_exact(sock, 4) if b1 & 0x80 else None
+    payload = _recv_exact(sock, n)
+    if key:
+        payload = _xor_mask(payload, key)
+    return bool(b0 & 0x80), b0 & 0x0F, payload
+
+def _accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+class WebSocketClient:
+    def __init__(self, url, timeout=2.0):
+        parts = urlsplit(url)
+        self.sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {parts.hostname}:{parts.port}\r\n"
+                           "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                           f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("handshake failed")
+            response += chunk
+        head = response.split(b"\r\n\r\n", 1)[0].decode("latin-1")
+        if " 101 " not in head.split("\r\n", 1)[0] or _accept_key(key) not in head:
+            raise ConnectionError(f"handshake refused: {head.splitlines()[0]}")
+
+    def send_text(self, text):
+        write_frame(self.sock, OP_TEXT, text.encode("utf-8"), mask=True)
+
+    def recv_text(self, timeout=None):
+        """ Next text message, None on timeout. Answers pings, raises on close """
+        message = b""
+        while True:
+            if timeout is not None and not message:
+                ready, _, _ = select.select([self.sock], [], [], timeout)
+                if not ready:
+                    return None
+            fin, opcode, payload = read_frame(self.sock)
+            if opcode == OP_PING:
+                write_frame(self.sock, OP_PONG, payload, mask=True)
+            elif opcode == OP_CLOSE:
+                raise ConnectionError("closed by server")
+            elif opcode in (OP_TEXT, OP_CONT):
+                message += payload
+                if fin:
+                    return message.decode("utf-8")
+
+    def drain(self):
+        """ Discards whatever the server already sent, without waiting """
+        while self.recv_text(timeout=0) is not None:
+            pass
+
+    def close(self):
+        try:
+            write_frame(self.sock, OP_CLOSE, b"", mask=True)
+        except OSError:
+            pass
+        self.sock.close()
+
+# --- AVATAR PROTOCOLS ---
+class VTubeStudioProtocol:
+    """ VTube Studio public API: hotkeys for states, custom parameters for scores """
+    default_url = "ws://127.0.0.1:8001"
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.token = None
+        if os.path.exists(VTS_TOKEN_FILE):
+            with open(VTS_TOKEN_FILE) as f:
+                self.token = f.read().strip() or None
+
+    def _message(self, message_type, data=None):
+        return json.dumps({"apiName": "VTubeStudioPublicAPI", "apiVersion": "1.0",
+                           "requestID": uuid.uuid4().hex[:16], "messageType": message_type, "data": data or {}})
+
+    def _request(self, ws, message_type, data=None, timeout=5.0):
+        ws.send_text(self._message(message_type, data))
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            text = ws.recv_text(timeout=deadline - time.time())
+            if text is None:
+                break
+            reply = json.loads(text)
+            if reply.get("messageType") != "VTubeStudioAPIStateBroadcast":
+                return reply
+        raise ConnectionError(f"no answer to {message_type}")
+
+    def on_connect(self, ws):
+        plugin = {"pluginName": "VeadoController", "pluginDeveloper": "VeadoController"}
+        if not self.token:
+            # VTube Studio shows an allow/deny popup to the user here
+            reply = self._request(ws, "AuthenticationTokenRequest", plugin, timeout=60.0)
+            self.token = reply.get("data", {}).get("authenticationToken")
+            if not self.token:
+                raise ConnectionError("VTube Studio refused the plugin")
+            with open(VTS_TOKEN_FILE, "w") as f:
+                f.write(self.token)
+        reply = self._request(ws, "AuthenticationRequest", dict(plugin, authenticationToken=self.token))
+        if not reply.get("data", {}).get("authenticated"):
+            self.token = None
+            if os.path.exists(VTS_TOKEN_FILE):
+                os.remove(VTS_TOKEN_FILE)
+            raise ConnectionError("VTube Studio token rejected")
+        if self.settings.get("stream_scores"):
+            for act in self.settings.get("parameters", {}):
+                self._request(ws, "ParameterCreationRequest", {
+                    "parameterName": self.parameter_name(act), "explanation": f"VeadoController {act} score",
+                    "min": 0, "max": 1, "defaultValue": 0})
+
+    def parameter_name(self, act):
+        return self.settings.get("parameters", {}).get(act)
+
+    def state_messages(self, action, state_id):
+        return [self._message("HotkeyTriggerRequest", {"hotkeyID": state_id})]
+
+    def score_messages(self, scores):
+        # One request carries every parameter of the frame
+        values = [{"id": self.parameter_name(act), "value": round(float(v), 4)}
+                  for act, v in scores.items() if self.parameter_name(act)]
+        if not values:
+            return []
+        return [self._message("InjectParameterDataRequest", {"faceFound": True, "mode": "set", "parameterValues": values})]
+
+class VeadotubeProtocol:
+    """ veadotube instance API: state changes only, it has no continuous parameters """
+    default_url = "ws://127.0.0.1:40404/?n=VeadoController"
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def on_connect(self, ws):
+        pass
+
+    def state_messages(self, action, state_id):
+        payload = {"event": "payload", "type": "stateEvents", "id": self.settings.get("instance", "mini"),
+                   "name": "avatar state", "payload": {"event": "set", "state": state_id}}
+        return ["nodes:" + json.dumps(payload)]
+
+    def score_messages(self, scores):
+        return []
+
+PROTOCOLS = {"vtubestudio": VTubeStudioProtocol, "veadotube": VeadotubeProtocol}
+
+# --- OUTPUT BACKEND ---
+class WebSocketBackend:
+    """ Output backend for KeyDispatcher (same send/send_scores/close interface).
+    Keeps one connection open and falls back to the key backend while disconnected.
+    Connecting and authenticating (VTube Studio waits for the user's allow/deny popup)
+    happen on a background thread that retries with exponential backoff, so the
+    dispatcher thread never waits for the avatar app """
+    def __init__(self, settings, fallback=None):
+        self.settings = settings
+        self.protocol = PROTOCOLS[settings.get("protocol", "vtubestudio")](settings)
+        self.url = settings.get("url") or self.protocol.default_url
+        self.states = settings.get("states", {})
+        self.fallback = fallback
+        self.ws = None
+        self.backoff = 0.5
+        self.next_attempt = 0.0
+        self.sent_messages = 0
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.connector = None
+        self._start_connector()
+
+    @property
+    def connected(self):
+        return self.ws is not None
+
+    def wait_connected(self, timeout):
+        deadline = time.time() + timeout
+        while self.ws is None and time.time() < deadline and not self.closed.wait(0.01):
+            pass
+        return self.ws is not None
+
+    def _start_connector(self):
+        with self.lock:
+            if self.ws or self.closed.is_set() or (self.connector and self.connector.is_alive()):
+                return
+            self.connector = threading.Thread(target=self._connect_loop, daemon=True)
+            self.connector.start()
+
+    def _connect_loop(self):
+        while not self.closed.wait(max(0.0, self.next_attempt - time.time())):
+            try:
+                ws = WebSocketClient(self.url)
+                self.protocol.on_connect(ws)
+            except (OSError, ConnectionError, ValueError) as e:
+                self.next_attempt = time.time() + self.backoff
+                print(f"Avatar connection failed ({e}), retry in {self.backoff:.1f} s")
+                self.backoff = min(self.backoff * 2, 10.0)
+                continue
+            with self.lock:
+                accepted = not self.closed.is_set()
+                if accepted:
+                    self.ws = ws
+            if not accepted:
+                ws.close()
+                return
+            self.backoff = 0.5
+            print(f"Avatar connected: {self.url}")
+            return
+
+    def _ensure_connected(self):
+        """ Never blocks: False while disconnected, with a reconnect going on in the background """
+        if self.ws is None:
+            self._start_connector()
+        return self.ws is not None
+
+    def _send_all(self, messages):
+        try:
+            for text in messages:
+                self.ws.send_text(text)
+                self.sent_messages += 1
+            self.ws.drain()
+            return True
+        except (OSError, ConnectionError):
+            print("Avatar connection lost")
+            self._drop()
+            return False
+
+    def _drop(self):
+        if self.ws:
+            try: self.ws.close()
+            except OSError: pass
+        self.ws = None
+        self.next_attempt = time.time() + self.backoff
+        self._start_connector()
+
+    def send(self, action, key):
+        state_id = self.states.get(action)
+        if state_id and self._ensure_connected() and self._send_all(self.protocol.state_messages(action, state_id)):
+            return
+        if self.fallback:
+            self.fallback.send(action, key)
+
+    def send_scores(self, scores):
+        if scores and self._ensure_connected():
+            self._send_all(self.protocol.score_messages(scores))
+
+    def close(self):
+        self.closed.set()
+        self._drop()
+
+# --- MOCK SERVER ---
+class MockAvatarServer:
+    """ Minimal local avatar app: accepts WebSocket clients, records every text message
+    and answers VTube Studio requests so the backend can be exercised offline """
+    def __init__(self, host="127.0.0.1", port=0, verbose=False):
+        self.server = socket.create_server((host, port))
+        self.port = self.server.getsockname()[1]
+        self.url = f"ws://{host}:{self.port}"
+        self.verbose = verbose
+        self.messages = []
+        self.clients = []
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            self.clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            request = b""
+            while b"\r\n\r\n" not in request:
+                chunk = conn.recv(1024)
+                if not chunk:
+                    return
+                request += chunk
+            key = [l.split(":", 1)[1].strip() for l in request.decode("latin-1").split("\r\n")
+                   if l.lower().startswith("sec-websocket-key:")][0]
+            conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {_accept_key(key)}\r\n\r\n").encode())
+            while self.running:
+                fin, opcode, payload = read_frame(conn)
+                if opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    write_frame(conn, OP_PONG, payload, mask=False)
+                    continue
+                text = payload.decode("utf-8")
+                self.messages.append(text)
+                if self.verbose:
+                    print(f"mock <- {text}")
+                reply = self._reply(text)
+                if reply:
+                    write_frame(conn, OP_TEXT, reply.encode("utf-8"), mask=False)
+        except (OSError, ConnectionError, IndexError):
+            pass
+        finally:
+            conn.close()
+
+    def _reply(self, text):
+        try:
+            request = json.loads(text)
+        except ValueError:
+            return None
+        message_type = request.get("messageType", "")
+        data = {}
+        if message_type == "AuthenticationTokenRequest":
+            data = {"authenticationToken": "mock-token"}
+        elif message_type == "AuthenticationRequest":
+            data = {"authenticated": True, "reason": "mock"}
+        return json.dumps({"apiName": "VTubeStudioPublicAPI", "apiVersion": "1.0",
+                           "requestID": request.get("requestID"),
+                           "messageType": message_type.replace("Request", "Response"), "data": data})
+
+    def disconnect_clients(self):
+        """ Simulates the avatar app restarting """
+        for conn in self.clients:
+            try: conn.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+        self.clients = []
+
+    def close(self):
+        self.running = False
+        self.disconnect_clients()
+        self.server.close()
+
+def demo():
+    """ Offline round trip: mock server, backend, a drop and a reconnect """
+    class PrintFallback:
+        def send(self, action, key):
+            print(f"fallback key: {action} -> {key}")
+
+    server = MockAvatarServer()
+    settings = {"protocol": "vtubestudio", "url": server.url, "stream_scores": True,
+                "states": {"SMILE": "hotkey-smile", "NEUTRAL": "hotkey-neutral"}, "parameters": {"SMILE": "VeadoSmile"}}
+    global VTS_TOKEN_FILE
+    VTS_TOKEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".mock_vts_token")
+    backend = WebSocketBackend(settings, fallback=PrintFallback())
+    backend.send("SMILE", "f14")  # still connecting -> key fallback
+    backend.wait_connected(2.0)
+    backend.send("SMILE", "f14")
+    backend.send_scores({"SMILE": 0.8})
+    backend.send("WINK", "f19")  # no avatar state mapped -> key fallback
+    time.sleep(0.1)  # let the mock read what was sent before dropping it
+    server.disconnect_clients()
+    time.sleep(0.1)
+    backend.send("NEUTRAL", "f13")  # connection lost -> fallback, reconnect in the background
+    backend.wait_connected(backend.backoff + 2.0)
+    backend.send("SMILE", "f14")
+    backend.close()
+    time.sleep(0.1)
+    server.close()
+    if os.path.exists(VTS_TOKEN_FILE):
+        os.remove(VTS_TOKEN_FILE)
+    types = [json.loads(m)["messageType"] for m in server.messages]
+    print(f"mock received: {types}")
+    return 0 if types.count("HotkeyTriggerRequest") == 2 and "InjectParameterDataRequest" in types else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avatar WebSocket output tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mock = sub.add_parser("mock", help="run a local mock avatar app")
+    mock.add_argument("--port", type=int, default=8001)
+    sub.add_parser("demo", help="offline round trip against the mock")
+    args = parser.parse_args(argv)
+
+    if args.command == "demo":
+        return demo()
+    server = MockAvatarServer(port=args.port, verbose=True)
+    print(f"Mock avatar app listening on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
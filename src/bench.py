@@ -0,0 +1,96 @@
+""" Benchmark suite: running modes x hand inference x input resolutions over a recorded video.
+
+    python bench.py recording.mp4 --save bench.json
+    python bench.py recording.mp4 --baseline bench.json   # exit code 1 on regression
+    python bench.py recording.mp4 --gate                  # also measure with the motion gate on
+
+Cases infer every frame unless they are named ".../gate". Gated cases depend on how still
+the clip is, so their number of skipped inferences is compared too.
+"""
+import sys
+import json
+import argparse
+
+from main import RUNNING_MODES, CONFIG_FILE, load_config_file
+from headless import iter_frames, resize_to_width, run
+
+def case_name(case):
+    name = f"{case['mode']}/{'hands' if case['hands'] else 'face'}/{case['width']}px"
+    return name + "/gate" if case.get("gate") else name
+
+def run_suite(frames, config, modes, widths, parallel=True, gate=False):
+    """ Every case infers every frame; gate=True adds the same cases with the motion gate on """
+    results = []
+    for width in widths:
+        scaled = [(resize_to_width(f, width), t) for f, t in frames]
+        for mode in modes:
+            for hands in (True, False):
+                for gated in ((False, True) if gate else (False,)):
+                    report = run(scaled, config, mode, hands=hands, parallel=parallel, gate=gated)
+                    report.pop("timeline")
+                    report["width"] = width
+                    report["gate"] = gated
+                    report["name"] = case_name(report)
+                    results.append(report)
+                    lat = report["latency_ms"]
+                    print(f"{report['name']:<33} {report['fps']:7.1f} fps   "
+                          f"p50 {lat['p50']:6.1f}  p95 {lat['p95']:6.1f}  p99 {lat['p99']:6.1f} ms"
+                          + (f"   {report['inferences_skipped']} skipped" if gated else ""))
+    return results
+
+def compare(results, baseline, tolerance):
+    """ Returns the cases whose fps dropped, or p95 latency grew, by more than tolerance.
+    A gated case whose skipped-inference count moved by more than tolerance of its frames
+    is reported too: its timings are not comparable to the baseline """
+    previous = {r["name"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(r["name"])
+        if not old:
+            continue
+        if r["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append(f"{r['name']}: fps {old['fps']:.1f} -> {r['fps']:.1f}")
+        if r["latency_ms"]["p95"] > old["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{r['name']}: p95 {old['latency_ms']['p95']:.1f} -> {r['latency_ms']['p95']:.1f} ms")
+        skipped, old_skipped = r.get("inferences_skipped", 0), old.get("inferences_skipped", 0)
+        if abs(skipped - old_skipped) > tolerance * max(r["frames"], 1):
+            regressions.append(f"{r['name']}: skipped inferences {old_skipped} -> {skipped}, not comparable")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark EmotionDetector on a recorded video.")
+    parser.add_argument("source", help="video file, image folder or glob pattern")
+    parser.add_argument("--modes", nargs="+", choices=RUNNING_MODES, default=list(RUNNING_MODES))
+    parser.add_argument("--widths", nargs="+", type=int, default=[320, 640, 1280])
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--no-parallel", action="store_true")
+    parser.add_argument("--gate", action="store_true", help="also run every case with the motion gate on")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --save file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    config = load_config_file(args.config)
+    # Decode once so video decoding is not part of the measurement
+    frames = list(iter_frames(args.source, max_frames=args.max_frames))
+    if not frames:
+        print(f"No frames read from {args.source}")
+        return 2
+
+    results = run_suite(frames, config, args.modes, args.widths, parallel=not args.no_parallel, gate=args.gate)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+""" Headless runner: drives EmotionDetector over a video file or an image sequence.
+
+No Tk window and no key output, so it runs on build machines without a webcam:
+
+    python headless.py recording.mp4 --mode VIDEO --width 640 --output report.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+from main import EmotionDetector, RUNNING_MODES, CONFIG_FILE, BLENDSHAPE_NAMES, load_config_file
+from recording import TraceRecorder
+from metrics import METRICS
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# --- FRAME SOURCES ---
+def iter_frames(source, fps=30.0, max_frames=None):
+    """ Yields (frame, media_time_s) from a video file, an image folder or a glob pattern """
+    if os.path.isdir(source) or any(c in source for c in "*?["):
+        pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+        paths = sorted(p for p in glob.glob(pattern) if p.lower().endswith(IMAGE_EXTENSIONS))
+        for i, path in enumerate(paths[:max_frames]):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield frame, i / fps
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video source: {source}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or fps
+    i = 0
+    try:
+        while max_frames is None or i < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame, i / fps
+            i += 1
+    finally:
+        cap.release()
+
+def resize_to_width(frame, width):
+    if not width or frame.shape[1] == width:
+        return frame
+    h, w = frame.shape[:2]
+    return cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+# --- RUN ---
+def latency_summary(latencies_ms):
+    if not latencies_ms:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    arr = np.asarray(latencies_ms)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"mean": float(arr.mean()), "p50": float(p50), "p95": float(p95),
+            "p99": float(p99), "max": float(arr.max())}
+
+def run(frames, config, running_mode="VIDEO", hands=True, parallel=True, detector=None, gate=True):
+    """ Runs the detection pipeline over (frame, media_time_s) pairs and returns a report dict.
+    gate=False infers every frame whatever config['motion_gate'] says """
+    detector = detector or EmotionDetector(running_mode=running_mode, parallel=parallel, hands=hands, rules=config,
+                                           windows=config.get('windows'), hysteresis=config.get('hysteresis'),
+                                           motion_gate=config.get('motion_gate') if gate else None)
+    thresholds = dict(config['thresholds'])
+    enabled_dict = dict(config['enabled'])
+    min_durations = dict(config['min_durations'])
+    if not hands:
+        for act in detector.rules.hand_rules:
+            enabled_dict[act] = False
+
+    timeline = []
+    latencies = []
+    resolution = None
+
+    def record(frame_index, media_time, action):
+        if action != detector.current_action:
+            detector.current_action = action
+            timeline.append({"frame": frame_index, "time": round(media_time, 3), "action": action})
+
+    # LIVE_STREAM answers through callbacks: latency is submit -> decision
+    submitted = {}
+    lock = threading.Lock()
+
+    def on_action(action, timestamp_ms):
+        with lock:
+            info = submitted.pop(timestamp_ms, None)
+            # Frames MediaPipe dropped never get a callback
+            for ts in [t for t in submitted if t < timestamp_ms]:
+                del submitted[ts]
+            if info:
+                frame_index, media_time, start = info
+                latencies.append((time.perf_counter() - start) * 1000)
+                record(frame_index, media_time, action)
+
+    live = detector.running_mode == "LIVE_STREAM"
+    if live:
+        detector.on_action = on_action
+
+    METRICS.reset()
+    frame_count = 0
+    wall_start = time.perf_counter()
+    for frame_index, (frame, media_time) in enumerate(frames):
+        resolution = resolution or [frame.shape[1], frame.shape[0]]
+        start = time.perf_counter()
+        if live:
+            with lock:
+                action = detector.detect(frame, thresholds, enabled_dict, min_durations, now=media_time)
+                if detector.last_inference_skipped:
+                    # Motion gate reused the last features: decided synchronously, no callback
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    record(frame_index, media_time, action)
+                else:
+                    submitted[detector.last_timestamp_ms] = (frame_index, media_time, start)
+        else:
+            action = detector.detect(frame, thresholds, enabled_dict, min_durations, now=media_time)
+            latencies.append((time.perf_counter() - start) * 1000)
+            record(frame_index, media_time, action)
+        frame_count += 1
+
+    if live:
+        deadline = time.perf_counter() + 5.0
+        while time.perf_counter() < deadline:
+            with lock:
+                if not submitted: break
+            time.sleep(0.01)
+        detector.on_action = None
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "mode": detector.running_mode,
+        "hands": hands,
+        "parallel": bool(detector.pool),
+        "resolution": resolution,
+        "frames": frame_count,
+        "decisions": len(latencies),
+        "fps": frame_count / wall if wall > 0 else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "hand_frames_skipped": detector.hand_scheduler.skipped,
+        "inferences_skipped": detector.motion_gate.skipped if detector.motion_gate else 0,
+        "stages": METRICS.summary()["stages"],
+        "timeline": timeline,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run EmotionDetector over a video file or image sequence.")
+    parser.add_argument("source", help="video file, image folder or glob pattern")
+    parser.add_argument("--mode", choices=RUNNING_MODES, default="VIDEO")
+    parser.add_argument("--no-hands", action="store_true", help="disable hand inference and the rules that need it")
+    parser.add_argument("--no-parallel", action="store_true", help="run face and hand models one after the other")
+    parser.add_argument("--no-gate", action="store_true", help="infer every frame (disable the motion gate)")
+    parser.add_argument("--width", type=int, default=None, help="resize frames to this width before inference")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate of image sequences")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--record", help="also write a feature trace (see recording.py)")
+    args = parser.parse_args(argv)
+
+    config = load_config_file(args.config)
+    frames = ((resize_to_width(f, args.width), t) for f, t in iter_frames(args.source, args.fps, args.max_frames))
+    detector = EmotionDetector(running_mode=args.mode, parallel=not args.no_parallel, hands=not args.no_hands,
+                               rules=config, windows=config['windows'], hysteresis=config['hysteresis'],
+                               motion_gate=None if args.no_gate else config['motion_gate'])
+    if args.record:
+        detector.recorder = TraceRecorder(args.record, BLENDSHAPE_NAMES)
+    try:
+        report = run(frames, config, hands=not args.no_hands, detector=detector)
+    finally:
+        if detector.recorder:
+            detector.recorder.close()
+    report["source"] = args.source
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"{report['frames']} frames, {report['fps']:.1f} fps, "
+              f"p95 {report['latency_ms']['p95']:.1f} ms -> {args.output}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
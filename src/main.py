@@ -2,32 +2,78 @@ import os
 import sys
 from collections import deque
 import time
+STARTUP_T0 = time.perf_counter()
 import json
 import math
+import queue
 import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
 
-# --- CONFIGURATION DYNAMIQUE TCL/TK ---
-if getattr(sys, 'frozen', False):
-    base_path = sys._MEIPASS
-    tcl_dir = os.path.join(base_path, 'tcl', 'tcl8.6')
-    tk_dir = os.path.join(base_path, 'tcl', 'tk8.6')
-else:
-    base_path = sys.base_prefix
-    tcl_dir = os.path.join(base_path, "tcl", "tcl8.6")
-    tk_dir = os.path.join(base_path, "tcl", "tk8.6")
-
-if os.path.exists(tcl_dir):
-    os.environ['TCL_LIBRARY'] = tcl_dir
-    os.environ['TK_LIBRARY'] = tk_dir
-
-import tkinter as tk
-from tkinter import ttk, messagebox
-import cv2
-import PIL.Image, PIL.ImageTk
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-import pyautogui
+import numpy as np
+import PIL.Image
+from recording import TraceRecorder, HAND_SLOTS
+from avatar_ws import WebSocketBackend
+from metrics import METRICS, MetricsExporter
+from rules import RuleSet, rules_spec
+from shm_bus import BusPublisher
+
+# Tkinter: imported by load_tk() when a window opens, so the headless runner, the benchmark
+# and the tuner also run where Tk is not installed
+tk = ttk = messagebox = None
+
+def load_tk():
+    """ Points Tcl/Tk at its libraries (frozen exe or base Python), imports tkinter once, returns it """
+    global tk, ttk, messagebox
+    if tk is not None:
+        return tk
+    # --- CONFIGURATION DYNAMIQUE TCL/TK ---
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+        tcl_dir = os.path.join(base_path, 'tcl', 'tcl8.6')
+        tk_dir = os.path.join(base_path, 'tcl', 'tk8.6')
+    else:
+        base_path = sys.base_prefix
+        tcl_dir = os.path.join(base_path, "tcl", "tcl8.6")
+        tk_dir = os.path.join(base_path, "tcl", "tk8.6")
+
+    if os.path.exists(tcl_dir):
+        os.environ['TCL_LIBRARY'] = tcl_dir
+        os.environ['TK_LIBRARY'] = tk_dir
+
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+    import PIL.ImageTk  # PhotoImage for PreviewRenderer
+    return tk
+
+# Heavy modules (seconds to import in the frozen exe): loaded by load_heavy_modules(),
+# off the Tk thread, so the window shows up immediately
+cv2 = mp = python = vision = pyautogui = None
+_heavy_lock = threading.Lock()
+_heavy_loaded = False
+
+def load_heavy_modules():
+    """ Imports cv2, mediapipe and pyautogui once. Returns the time spent, 0 if already loaded """
+    global cv2, mp, python, vision, pyautogui, _heavy_loaded
+    with _heavy_lock:
+        if _heavy_loaded:
+            return 0.0
+        start = time.perf_counter()
+        import cv2
+        import mediapipe as mp
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import vision
+        try:
+            import pyautogui
+        except Exception:
+            # No display (headless runner, build machines): key output unavailable
+            pyautogui = None
+        _heavy_loaded = True
+        return time.perf_counter() - start
 
 def resource_path(relative_path):
     """ Path management for files included in the EXE """
@@ -41,6 +87,261 @@ def resource_path(relative_path):
 CONFIG_FILE = "config.json"
 FACE_MODEL_PATH = resource_path('models/face_landmarker.task')
 HAND_MODEL_PATH = resource_path('models/hand_landmarker.task')
+TRACE_DIR = "traces"
+
+# MediaPipe face blendshape categories, in model output order
+BLENDSHAPE_NAMES = [
+    "_neutral", "browDownLeft", "browDownRight", "browInnerUp", "browOuterUpLeft", "browOuterUpRight",
+    "cheekPuff", "cheekSquintLeft", "cheekSquintRight", "eyeBlinkLeft", "eyeBlinkRight",
+    "eyeLookDownLeft", "eyeLookDownRight", "eyeLookInLeft", "eyeLookInRight", "eyeLookOutLeft",
+    "eyeLookOutRight", "eyeLookUpLeft", "eyeLookUpRight", "eyeSquintLeft", "eyeSquintRight",
+    "eyeWideLeft", "eyeWideRight", "jawForward", "jawLeft", "jawOpen", "jawRight", "mouthClose",
+    "mouthDimpleLeft", "mouthDimpleRight", "mouthFrownLeft", "mouthFrownRight", "mouthFunnel",
+    "mouthLeft", "mouthLowerDownLeft", "mouthLowerDownRight", "mouthPressLeft", "mouthPressRight",
+    "mouthPucker", "mouthRight", "mouthRollLower", "mouthRollUpper", "mouthShrugLower",
+    "mouthShrugUpper", "mouthSmileLeft", "mouthSmileRight", "mouthStretchLeft", "mouthStretchRight",
+    "mouthUpperUpLeft", "mouthUpperUpRight", "noseSneerLeft", "noseSneerRight"
+]
+BLENDSHAPE_INDEX = {name: i for i, name in enumerate(BLENDSHAPE_NAMES)}
+
+# --- CONFIG FILE ---
+def default_config():
+    return {
+        "keys": {
+            "NEUTRAL": "f13", "SMILE": "f14", "FROWN": "f15", 
+            "RAISE": "f16", "MALICIOUS": "f17", "TILT": "f18", 
+            "WINK": "f19", "THINKING": "f20"
+        },
+        "thresholds": {
+            "SMILE": 0.5, "FROWN": 0.4, "RAISE": 0.5, 
+            "MALICIOUS": 0.7, "TILT": 0.3, "WINK": 0.2, "THINKING": 0.6
+        },
+        "enabled": {
+            "SMILE": True, "FROWN": True, "RAISE": True, 
+            "MALICIOUS": True, "TILT": True, "WINK": True, "THINKING": True
+        },
+        "min_durations": {
+            "SMILE": 0.5, "FROWN": 0.5, "RAISE": 0.5, 
+            "MALICIOUS": 1.0, "TILT": 0.5, "WINK": 0.2, "THINKING": 1.0
+        },
+        "hysteresis": {
+            "SMILE": 0.15, "FROWN": 0.15, "RAISE": 0.15, 
+            "MALICIOUS": 0.15, "TILT": 0.10, "WINK": 0.15, "THINKING": 0.15
+        },
+        "windows": {
+            "SMILE": 6, "FROWN": 6, "RAISE": 4, 
+            "MALICIOUS": 5, "TILT": 6, "WINK": 4, "THINKING": 5
+        },
+        # Emotion rules (see rules.py): helper features, one expression per emotion,
+        # which emotions suppress it, and the priority order when several are active
+        "features": {
+            "brow_down": "max(browDownLeft, browDownRight)",
+            "smile": "(mouthSmileLeft + mouthSmileRight) / 2"
+        },
+        "rules": {
+            "SMILE": {"expr": "smile", "suppressed_by": ["MALICIOUS", "WINK", "TILT"]},
+            "FROWN": {"expr": "where(browInnerUp > 0.4, 0.0, brow_down)", "suppressed_by": ["MALICIOUS", "WINK"]},
+            "RAISE": {"expr": "browInnerUp", "suppressed_by": ["TILT"]},
+            "MALICIOUS": {"expr": "where(brow_down < 0.25 or smile < 0.25, 0.0, (brow_down + smile) / 2)"},
+            "TILT": {"expr": "abs(left_eye_y - right_eye_y) * 5.0", "suppressed_by": ["MALICIOUS", "WINK"]},
+            "WINK": {"expr": "abs(eyeBlinkLeft - eyeBlinkRight)", "suppressed_by": ["MALICIOUS"]},
+            "THINKING": {"expr": "max(0.0, (0.20 - hand_chin_dist) * 5.0)", "requires_hands": True}
+        },
+        "priority": ["THINKING", "MALICIOUS", "WINK", "TILT", "FROWN", "RAISE", "SMILE"],
+        "pipeline": True,
+        "running_mode": "VIDEO",
+        "parallel_inference": True,
+        "record_trace": False,
+        "preview_fps": 30,
+        "video_source": 0,
+        "governor": {
+            "enabled": True,
+            "capture_width": 1280,
+            "capture_height": 720,
+            "capture_fps": 30,
+            "inference_width": 640,
+            "min_inference_width": 320,
+            "min_inference_fps": 10,
+            "target_cpu": 0.75,
+            "latency_budget_ms": 60,
+            "level": 0
+        },
+        "motion_gate": {
+            "enabled": True,
+            "threshold": 3.0,
+            "max_skip": 10,
+            "face_roi": True
+        },
+        "performers": [],
+        # Latest frame and result in shared memory for other local programs (see shm_bus.py)
+        "shm_bus": {
+            "enabled": False,
+            "name": "veado"
+        },
+        "metrics": {
+            "overlay": False,
+            "export_path": "",
+            "export_interval": 5.0
+        },
+        "websocket": {
+            "enabled": False,
+            "protocol": "vtubestudio",
+            "url": "",
+            "states": {},
+            "stream_scores": False,
+            "parameters": {
+                "SMILE": "VeadoSmile", "FROWN": "VeadoFrown", "RAISE": "VeadoRaise",
+                "MALICIOUS": "VeadoMalicious", "TILT": "VeadoTilt", "WINK": "VeadoWink", "THINKING": "VeadoThinking"
+            }
+        }
+    }
+
+RULE_DEFAULTS = {"keys": "", "thresholds": 0.5, "enabled": True, "min_durations": 0.5, "hysteresis": 0.15, "windows": 5}
+
+def hands_needed(config):
+    """ True when an enabled rule needs the hand model """
+    return any(spec.get("requires_hands") and config['enabled'].get(act, True) for act, spec in config['rules'].items())
+
+def load_config_file(path=CONFIG_FILE):
+    default = default_config()
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                loaded = json.load(f)
+                if not isinstance(loaded, dict):
+                    raise ValueError("not a JSON object")
+                config = default.copy()
+                if "keys" in loaded and "HAPPY" in loaded["keys"]:
+                    config = default
+                else:
+                    config.update(loaded)
+                    for key in ["keys", "thresholds", "enabled", "min_durations", "hysteresis", "windows", "websocket", "metrics", "motion_gate", "governor", "shm_bus"]:
+                         if not isinstance(config.get(key), dict): config[key] = default[key]
+                         for act in default[key]:
+                             if act not in config[key]: config[key][act] = default[key][act]
+                    try:
+                        RuleSet(rules_spec(config), RULE_INPUTS).self_test()
+                    except ValueError as e:
+                        print(f"Invalid rules in {path}: {e}; using the default rules")
+                        for key in ["features", "rules", "priority"]: config[key] = default[key]
+                    # Custom rules get the usual per-emotion settings
+                    for act in config["rules"]:
+                        for key, value in RULE_DEFAULTS.items():
+                            config[key].setdefault(act, value)
+        except (OSError, ValueError) as e:
+            # Unreadable file or invalid JSON; a bad rule only replaces the rules (above)
+            print(f"Could not read {path}: {e}; using the default config")
+            config = default
+    else:
+        config = default
+    return config
+
+def write_config_text(text, path=CONFIG_FILE):
+    """ Atomic: a crash mid-write leaves the previous file, never a truncated one """
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def save_config_file(config, path=CONFIG_FILE):
+    write_config_text(json.dumps(config, indent=4), path)
+
+class ConfigWriter:
+    """ Saves the config from a background thread. Calls within `delay` seconds of each
+    other are coalesced and only the latest config is written """
+    def __init__(self, path=CONFIG_FILE, delay=1.0):
+        self.path = path
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.pending = None
+        self.due = 0.0
+        self.closing = False
+        self.writes = 0
+        self.error = None  # OSError of the last write, None once a write succeeds
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, config, delay=None):
+        """ Non-blocking. The config is serialized here, so the caller may keep changing it """
+        text = json.dumps(config, indent=4)
+        with self.lock:
+            self.pending = text
+            self.due = time.monotonic() + (self.delay if delay is None else delay)
+            self.idle.clear()
+        self.wake.set()
+
+    def flush(self, timeout=2.0):
+        """ Writes a pending save now and waits for it. False when it timed out or the
+        last write failed (see `error`) """
+        with self.lock:
+            self.due = 0.0
+        self.wake.set()
+        return self.idle.wait(timeout) and self.error is None
+
+    def close(self):
+        self.flush()
+        self.closing = True
+        self.wake.set()
+        self.thread.join(timeout=1.0)
+
+    def _run(self):
+        while not self.closing:
+            with self.lock:
+                wait = None if self.pending is None else self.due - time.monotonic()
+            if wait is None or wait > 0:
+                self.wake.wait(wait)
+                self.wake.clear()
+                continue
+            with self.lock:
+                text, self.pending = self.pending, None
+            try:
+                write_config_text(text, self.path)
+                self.writes += 1
+                self.error = None
+            except OSError as e:
+                print(f"Saving the config failed: {e}")
+                self.error = e
+            with self.lock:
+                if self.pending is None:
+                    self.idle.set()
+
+# --- SETTINGS SNAPSHOT ---
+def _frozen(mapping):
+    return MappingProxyType(dict(mapping))
+
+@dataclass(frozen=True)
+class Settings:
+    """ Per-emotion settings as one immutable object. The UI builds a new one when a widget
+    changes and swaps the reference; worker threads read whichever snapshot they picked up,
+    never a half-updated mix """
+    thresholds: Mapping[str, float]
+    enabled: Mapping[str, bool]
+    min_durations: Mapping[str, float]
+    keys: Mapping[str, str]
+
+    def __post_init__(self):
+        for field in ("thresholds", "enabled", "min_durations", "keys"):
+            object.__setattr__(self, field, _frozen(getattr(self, field)))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(thresholds={act: float(v) for act, v in config['thresholds'].items()},
+                   enabled={act: bool(v) for act, v in config['enabled'].items()},
+                   min_durations={act: float(v) for act, v in config['min_durations'].items()},
+                   keys=config['keys'])
+
+    @property
+    def detect_args(self):
+        """ (thresholds, enabled_dict, min_durations) as EmotionDetector.detect takes them """
+        return self.thresholds, self.enabled, self.min_durations
+
+    def apply_to(self, config):
+        """ Writes the snapshot back into a config dict (for saving) """
+        for key in ("thresholds", "enabled", "min_durations", "keys"):
+            config[key].update(getattr(self, key))
 
 # --- STABILIZATION LOGIC ---
 class StableScore:
@@ -59,125 +360,608 @@ class StableScore:
             
         return self.state, smoothed_value
 
+def moving_average(values, window, history=()):
+    """ Trailing mean over up to `window` samples, `history` being the samples already seen """
+    seq = np.concatenate([np.asarray(history, dtype=np.float64), np.asarray(values, dtype=np.float64)])
+    cs = np.concatenate([[0.0], np.cumsum(seq)])
+    end = np.arange(len(history), len(seq)) + 1
+    start = np.maximum(end - window, 0)
+    return (cs[end] - cs[start]) / (end - start)
+
+def hysteresis(smoothed, high, low, initial=False):
+    """ StableScore state for every sample, vectorized along the last axis.
+    high/low broadcast against smoothed, e.g. (K, 1) thresholds give K state rows for a sweep """
+    smoothed, high, low = np.broadcast_arrays(smoothed, high, low)
+    # Above high always means on, below low always off, in between keeps the previous state
+    event = np.where(smoothed > high, 1, np.where(smoothed < low, 0, -1))
+    idx = np.where(event >= 0, np.arange(event.shape[-1]), -1)
+    idx = np.maximum.accumulate(idx, axis=-1)
+    last = np.take_along_axis(event, np.maximum(idx, 0), axis=-1)
+    return np.where(idx >= 0, last == 1, bool(initial))
+
+class StableScoreBank:
+    """ StableScore for every emotion at once. The per-frame update() works on plain Python
+    lists and floats (NumPy scalar indexing would cost more than the work itself);
+    update_column()/update_batch() convert to arrays for N frames at a time """
+    def __init__(self, window_sizes):
+        self.names = list(window_sizes)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.windows = [int(window_sizes[n]) for n in self.names]
+        self.buffers = [[0.0] * w for w in self.windows]
+        n = len(self.names)
+        self.sums = [0.0] * n
+        self.counts = [0] * n
+        self.pos = [0] * n
+        self.states = [False] * n
+
+    def update(self, name, new_value, high_thresh, low_thresh):
+        """ Same contract as StableScore.update, O(1) per call """
+        i = self.index[name]
+        buffer, w, p = self.buffers[i], self.windows[i], self.pos[i]
+        new_value = float(new_value)
+        total = self.sums[i] + new_value
+        count = self.counts[i]
+        if count == w:
+            total -= buffer[p]
+        else:
+            self.counts[i] = count = count + 1
+        buffer[p] = new_value
+        p += 1
+        if p == w:
+            # Resync once per lap so the running sum cannot drift
+            p, total = 0, sum(buffer)
+        self.pos[i], self.sums[i] = p, total
+        smoothed_value = total / count
+
+        state = self.states[i]
+        if not state and smoothed_value > high_thresh:
+            self.states[i] = state = True
+        elif state and smoothed_value < low_thresh:
+            self.states[i] = state = False
+
+        return state, smoothed_value
+
+    def history(self, i):
+        """ Samples currently in the window of emotion i, oldest first """
+        buffer, c = self.buffers[i], self.counts[i]
+        if c < self.windows[i]:
+            return np.array(buffer[:c], dtype=np.float64)
+        p = self.pos[i]
+        return np.array(buffer[p:] + buffer[:p], dtype=np.float64)
+
+    def update_column(self, name, values, high_thresh, low_thresh, mask=None):
+        """ Feeds N samples of one emotion; frames where mask is False are skipped
+        (no update, state False) like a suppressed emotion in decide().
+        Returns (states, smoothed) of shape (N,), smoothed is NaN on skipped frames """
+        i = self.index[name]
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        mask = np.ones(n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        states = np.zeros(n, dtype=bool)
+        smoothed = np.full(n, np.nan)
+        fed = values[mask]
+        if not len(fed):
+            return states, smoothed
+
+        high = np.broadcast_to(high_thresh, (n,))[mask]
+        low = np.broadcast_to(low_thresh, (n,))[mask]
+        w = self.windows[i]
+        hist = self.history(i)
+        sm = moving_average(fed, w, hist)
+        st = hysteresis(sm, high, low, self.states[i])
+        states[mask] = st
+        smoothed[mask] = sm
+
+        tail = np.concatenate([hist, fed])[-w:].tolist()
+        self.buffers[i][:len(tail)] = tail
+        self.counts[i] = len(tail)
+        self.pos[i] = len(tail) % w
+        self.sums[i] = sum(tail)
+        self.states[i] = bool(st[-1])
+        return states, smoothed
+
+    def update_batch(self, values, high_thresh, low_thresh, mask=None):
+        """ N frames x emotions (columns in self.names order), thresholds broadcast to (N, E) """
+        values = np.asarray(values, dtype=np.float64)
+        high = np.broadcast_to(high_thresh, values.shape)
+        low = np.broadcast_to(low_thresh, values.shape)
+        states = np.zeros(values.shape, dtype=bool)
+        smoothed = np.full(values.shape, np.nan)
+        for i, name in enumerate(self.names):
+            col_mask = None if mask is None else mask[:, i]
+            states[:, i], smoothed[:, i] = self.update_column(name, values[:, i], high[:, i], low[:, i], col_mask)
+        return states, smoothed
+
+# --- HAND SCHEDULING ---
+Point = namedtuple("Point", "x y")
+
+class HandScheduler:
+    """ Decides when the hand model runs and on which crop around the chin.
+    With keep_box (VIDEO/LIVE_STREAM), the hand model tracks its hands from one call to the
+    next in the coordinates of the image it was given, so the crop stays where it is while a
+    hand is found and only follows the chin again once the hand is lost """
+    def __init__(self, idle_interval=3, crop_radius=0.35, near_dist=0.30, keep_box=False):
+        self.idle_interval = idle_interval
+        self.crop_radius = crop_radius
+        self.near_dist = near_dist
+        self.keep_box = keep_box
+        self.chin = None
+        self.hand_near = False
+        self.tracking = False
+        self.ran = False  # the last plan() ran the hand model
+        self.box = None
+        self.frame_size = None
+        self.frames_idle = 0
+        self.skipped = 0
+
+    def plan(self, enabled, width, height):
+        """ Returns the crop box (x0, y0, x1, y1) in pixels, or None to skip the hand model """
+        box = self._plan(enabled, width, height)
+        self.ran = box is not None
+        return box
+
+    def _plan(self, enabled, width, height):
+        if not enabled or self.chin is None:
+            self.skipped += 1
+            return None
+        if not self.hand_near:
+            self.frames_idle += 1
+            if self.frames_idle < self.idle_interval:
+                self.skipped += 1
+                return None
+        self.frames_idle = 0
+        if self.keep_box and self.tracking and self.box and self.frame_size == (width, height):
+            return self.box
+
+        cx, cy = self.chin
+        r = self.crop_radius
+        x0, x1 = max(0, int((cx - r) * width)), min(width, int((cx + r) * width))
+        y0, y1 = max(0, int((cy - r) * height)), min(height, int((cy + r) * height))
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            self.skipped += 1
+            return None
+        self.box, self.frame_size = (x0, y0, x1, y1), (width, height)
+        return self.box
+
+    def observe(self, chin, min_dist):
+        """ Feedback from the decision logic: chin (x, y) or None, closest fingertip distance
+        (inf when no hand was found) """
+        self.chin = chin
+        self.hand_near = min_dist < self.near_dist
+        if self.ran:
+            self.tracking = min_dist < float("inf")
+
+def crop_image(rgb_frame, box):
+    x0, y0, x1, y1 = box
+    h, w = rgb_frame.shape[:2]
+    if (x0, y0, x1, y1) != (0, 0, w, h):
+        rgb_frame = np.ascontiguousarray(rgb_frame[y0:y1, x0:x1])
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+
+def hands_in_frame(hand_result, box, width, height):
+    """ Maps hand landmarks found in a crop back to full-frame normalized coordinates """
+    if not hand_result or not hand_result.hand_landmarks:
+        return []
+    x0, y0, x1, y1 = box
+    sx, sy = (x1 - x0) / width, (y1 - y0) / height
+    ox, oy = x0 / width, y0 / height
+    return [[Point(ox + p.x * sx, oy + p.y * sy) for p in hand] for hand in hand_result.hand_landmarks]
+
+# --- MOTION GATE ---
+class MotionGate:
+    """ Cheap change detector run before inference. Compares a small grayscale copy of the
+    frame (or of the region around the last face) with the last frame that was inferred;
+    a still frame reuses the previous features instead of running the models """
+    def __init__(self, threshold=3.0, max_skip=10, width=160, grid=8, face_roi=True):
+        self.threshold = threshold  # grey levels (0-255), mean difference of the most changed cell
+        self.max_skip = max_skip    # forced inference after this many reused frames
+        self.width = width
+        self.grid = grid
+        self.face_roi = face_roi
+        self.roi = None             # normalized (x0, y0, x1, y1) around the last face
+        self.small = None
+        self.gray = None
+        self.reference = None
+        self.since_inference = 0
+        self.checked = 0
+        self.skipped = 0
+
+    def still(self, frame):
+        """ True when the frame can reuse the last result """
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        if self.small is None or self.small.shape[1::-1] != size:
+            self.small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self.gray = np.empty((size[1], size[0]), dtype=np.uint8)
+            self.reference = None
+        cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        self.checked += 1
+
+        if self.reference is None or self.since_inference >= self.max_skip or self.change() > self.threshold:
+            self.reference = self.gray.copy()
+            self.since_inference = 0
+            return False
+        self.since_inference += 1
+        self.skipped += 1
+        return True
+
+    def change(self):
+        current, reference = self.gray, self.reference
+        if self.face_roi and self.roi:
+            gh, gw = current.shape
+            x0, y0, x1, y1 = self.roi
+            x0, x1 = int(x0 * gw), int(x1 * gw)
+            y0, y1 = int(y0 * gh), int(y1 * gh)
+            if x1 - x0 >= self.grid and y1 - y0 >= self.grid:
+                current, reference = current[y0:y1, x0:x1], reference[y0:y1, x0:x1]
+        # Max over a grid of cell means: a wink or a raised brow is local, a frame-wide mean would hide it
+        diff = cv2.absdiff(current, reference)
+        cells = cv2.resize(diff, (self.grid, self.grid), interpolation=cv2.INTER_AREA)
+        return float(cells.max())
+
+    def observe(self, box):
+        """ Face box (normalized) of the last inference, widened to include hands at the chin """
+        if box is None:
+            self.roi = None
+            return
+        x0, y0, x1, y1 = box
+        mx, my = (x1 - x0) * 0.5, (y1 - y0) * 0.5
+        self.roi = (max(0.0, x0 - mx), max(0.0, y0 - my), min(1.0, x1 + mx), min(1.0, y1 + my))
+
+    def reset(self):
+        self.reference = None
+        self.roi = None
+
+# --- FEATURES ---
+# Everything the decision logic reads from one frame: recordable and replayable without the models
+FrameFeatures = namedtuple("FrameFeatures", "blendshapes left_eye_y right_eye_y chin hand_tips")
+
+# Names the rule expressions can use besides the blendshapes (all in the trace format)
+LANDMARK_INPUTS = ["left_eye_y", "right_eye_y", "chin_x", "chin_y", "hand_chin_dist"]
+RULE_INPUTS = BLENDSHAPE_NAMES + LANDMARK_INPUTS
+
+def hand_chin_distance(features):
+    """ Closest thumb or index tip to the chin, inf without hands """
+    chin = features.chin
+    closest = float("inf")
+    for thumb_tip, index_tip in features.hand_tips:
+        dist_index = math.sqrt((chin.x - index_tip.x)**2 + (chin.y - index_tip.y)**2)
+        dist_thumb = math.sqrt((chin.x - thumb_tip.x)**2 + (chin.y - thumb_tip.y)**2)
+        closest = min(closest, dist_index, dist_thumb)
+    return closest
+
+def rule_inputs(features, closest):
+    """ One frame as the flat list of RULE_INPUTS values """
+    return features.blendshapes.tolist() + [features.left_eye_y, features.right_eye_y,
+                                            features.chin.x, features.chin.y, closest]
+
+def rule_input_columns(columns):
+    """ Trace columns as the list of RULE_INPUTS arrays (float64) """
+    col = lambda name: np.asarray(columns[name], dtype=np.float64)
+    chin_x, chin_y = col('chin_x'), col('chin_y')
+    closest = np.full(len(chin_x), np.nan)
+    for h in range(HAND_SLOTS):
+        dist_thumb = np.sqrt((chin_x - col(f"hand{h}_thumb_x"))**2 + (chin_y - col(f"hand{h}_thumb_y"))**2)
+        dist_index = np.sqrt((chin_x - col(f"hand{h}_index_x"))**2 + (chin_y - col(f"hand{h}_index_y"))**2)
+        # Missing hands are NaN, fmin keeps the other value
+        closest = np.fmin(closest, np.minimum(dist_index, dist_thumb))
+    closest[np.isnan(closest)] = np.inf
+    return [col(name) for name in BLENDSHAPE_NAMES] + [col('left_eye_y'), col('right_eye_y'), chin_x, chin_y, closest]
+
+def extract_features(face_result, hands):
+    """ Returns FrameFeatures, or None when no face was found """
+    if not (face_result.face_landmarks and face_result.face_blendshapes):
+        return None
+    landmarks = face_result.face_landmarks[0]
+    blendshapes = np.zeros(len(BLENDSHAPE_NAMES), dtype=np.float32)
+    for b in face_result.face_blendshapes[0]:
+        i = BLENDSHAPE_INDEX.get(b.category_name)
+        if i is not None:
+            blendshapes[i] = b.score
+    chin = landmarks[152]
+    return FrameFeatures(
+        blendshapes=blendshapes,
+        left_eye_y=landmarks[33].y,
+        right_eye_y=landmarks[263].y,
+        chin=Point(chin.x, chin.y),
+        hand_tips=[(Point(h[4].x, h[4].y), Point(h[8].x, h[8].y)) for h in hands]
+    )
+
+# Forehead, chin and both cheeks: enough to bound the face without scanning all 478 points
+FACE_OUTLINE = (10, 152, 234, 454)
+
+def face_box(face_result):
+    """ Normalized (x0, y0, x1, y1) of the face, or None """
+    if not face_result.face_landmarks:
+        return None
+    landmarks = face_result.face_landmarks[0]
+    xs = [landmarks[i].x for i in FACE_OUTLINE]
+    ys = [landmarks[i].y for i in FACE_OUTLINE]
+    return (min(xs), min(ys), max(xs), max(ys))
+
 # --- LOGIC AI ---
+RUNNING_MODES = ("IMAGE", "VIDEO", "LIVE_STREAM")
+_MISSING = object()
+
 class EmotionDetector:
-    def __init__(self):
+    def __init__(self, running_mode="IMAGE", parallel=False, load_models=True, windows=None, hysteresis=None, hands=True,
+                 motion_gate=None, rules=None):
         self.running = False
         self.cap = None
+        self.recorder = None
+
+        # Face and hand models run side by side, hand on a persistent worker
+        self.parallel = parallel
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hand") if parallel else None
+        self.overlap_saved_ms = 0.0
+        self.hand_scheduler = HandScheduler()
+
+        # Still frames reuse the last features (motion_gate: config section, None = always infer)
+        gate = dict(motion_gate or {})
+        self.motion_gate = MotionGate(**gate) if gate.pop("enabled", False) else None
+        self.last_features = None
+        self.last_inference_skipped = False
+
+        # LIVE_STREAM: results come back through MediaPipe callbacks
+        self.on_action = None
+        self.latest_action = "NEUTRAL"
+        self.last_timestamp_ms = -1
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        # Seconds spent in each loading step (imports, face_model, hand_model)
+        self.timings = {}
+        self.models_ready = False
+        self.face_detector = None
+        self.hand_detector = None
+        if load_models:
+            self.load_models(running_mode, hands)
+        else:
+            # Decision logic only (trace replay, tuning)
+            self.running_mode = "IMAGE"
+            self.has_hand_model = True
+
+        self.current_action = "NEUTRAL"
+
+        # Emotion rules: a compiled RuleSet, or a config holding "features"/"rules"/"priority"
+        defaults = default_config()
+        if not isinstance(rules, RuleSet):
+            rules = RuleSet(rules_spec(rules if rules and "rules" in rules else defaults), RULE_INPUTS)
+        self.rules = rules
+        self.actions = rules.actions
+        self.score_values = [0.0] * len(rules.names)
+
+        # Smoothing window (frames) and hysteresis gap (on above threshold, off below threshold - gap)
+        windows = dict(defaults['windows'], **(windows or {}))
+        self.hysteresis = dict(defaults['hysteresis'], **(hysteresis or {}))
+        for act in rules.names:
+            self.hysteresis.setdefault(act, RULE_DEFAULTS['hysteresis'])
+        self.stables = StableScoreBank({act: int(windows.get(act, RULE_DEFAULTS['windows'])) for act in rules.names})
         
+        self.unlock_time = 0 
+
+    def load_models(self, running_mode, hands=True):
+        """ Imports the heavy modules and creates the landmarkers. Safe to call from a
+        background thread; the hand model is skipped when hands is False (no enabled hand rule) """
+        self.timings["imports"] = load_heavy_modules()
+        try:
+            self._create_landmarkers(running_mode, hands)
+        except Exception as e:
+            if running_mode == "IMAGE": raise
+            print(f"{running_mode} mode unavailable ({e}), falling back to IMAGE")
+            self._create_landmarkers("IMAGE", hands)
+        self.models_ready = True
+
+    def _create_landmarkers(self, running_mode, hands):
+        mode = getattr(vision.RunningMode, running_mode)
+        live = running_mode == "LIVE_STREAM"
+
+        start = time.perf_counter()
         base_options_face = python.BaseOptions(model_asset_path=FACE_MODEL_PATH)
         options_face = vision.FaceLandmarkerOptions(
             base_options=base_options_face,
+            running_mode=mode,
             output_face_blendshapes=True,
-            num_faces=1
+            num_faces=1,
+            result_callback=self._on_face_result if live else None
         )
         self.face_detector = vision.FaceLandmarker.create_from_options(options_face)
+        self.running_mode = running_mode
+        self.timings["face_model"] = time.perf_counter() - start
 
+        self.has_hand_model = False
+        self.hand_detector = None
+        if hands:
+            self.load_hand_model()
+
+    def load_hand_model(self):
+        """ Also used later on, when a hand rule is enabled after starting without it """
+        start = time.perf_counter()
         try:
             base_options_hand = python.BaseOptions(model_asset_path=HAND_MODEL_PATH)
             options_hand = vision.HandLandmarkerOptions(
                 base_options=base_options_hand,
+                running_mode=getattr(vision.RunningMode, self.running_mode),
                 num_hands=2,
-                min_hand_detection_confidence=0.5
+                min_hand_detection_confidence=0.5,
+                result_callback=self._on_hand_result if self.running_mode == "LIVE_STREAM" else None
             )
             self.hand_detector = vision.HandLandmarker.create_from_options(options_hand)
             self.has_hand_model = True
+            self.hand_scheduler.keep_box = self.running_mode != "IMAGE"
         except:
             self.has_hand_model = False
+        self.timings["hand_model"] = time.perf_counter() - start
+        return self.has_hand_model
 
-        self.current_action = "NEUTRAL"
-        
-        self.stables = {
-            "FROWN": StableScore(window_size=6),
-            "SMILE": StableScore(window_size=6),
-            "RAISE": StableScore(window_size=4),
-            "MALICIOUS": StableScore(window_size=5),
-            "TILT": StableScore(window_size=6),
-            "WINK": StableScore(window_size=4),
-            "THINKING": StableScore(window_size=5)
-        }
-        
-        self.unlock_time = 0 
+    def _next_timestamp(self):
+        """ Monotonic, strictly increasing timestamps for VIDEO/LIVE_STREAM """
+        ts = int(time.monotonic() * 1000)
+        if ts <= self.last_timestamp_ms:
+            ts = self.last_timestamp_ms + 1
+        self.last_timestamp_ms = ts
+        return ts
+
+    def detect(self, frame, thresholds, enabled_dict, min_durations, now=None):
+        frame_start = time.perf_counter()
+        if self.motion_gate:
+            self.last_inference_skipped = self.motion_gate.still(frame)
+            METRICS.record("gate", (time.perf_counter() - frame_start) * 1000)
+            if self.last_inference_skipped:
+                METRICS.count("inferences_skipped")
+                return self._reuse_features(frame_start, thresholds, enabled_dict, min_durations, now)
 
-    def detect(self, frame, thresholds, enabled_dict, min_durations):
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
-        
-        face_result = self.face_detector.detect(mp_image)
-        
+        METRICS.record("convert", (time.perf_counter() - frame_start) * 1000)
+
+        height, width = rgb_frame.shape[:2]
+        want_hands = self.has_hand_model and any(enabled_dict.get(act, True) for act in self.rules.hand_rules)
+        box = self.hand_scheduler.plan(want_hands, width, height)
+        hand_image = crop_image(rgb_frame, box) if box else None
+
+        if self.running_mode == "LIVE_STREAM":
+            ts = self._next_timestamp()
+            with self._lock:
+                self._pending[ts] = [_MISSING, _MISSING if hand_image else None, box, width, height,
+                                     (thresholds, enabled_dict, min_durations, now), frame_start]
+            self.face_detector.detect_async(mp_image, ts)
+            if hand_image:
+                self.hand_detector.detect_async(hand_image, ts)
+            return self.latest_action
+
+        ts = self._next_timestamp() if self.running_mode == "VIDEO" else None
         hand_result = None
-        if self.has_hand_model:
-            hand_result = self.hand_detector.detect(mp_image)
-        
+        if self.pool and hand_image:
+            start = time.perf_counter()
+            hand_future = self.pool.submit(self._timed, self._run_hand, hand_image, ts)
+            face_result, face_time = self._timed(self._run_face, mp_image, ts)
+            hand_result, hand_time = hand_future.result()
+            saved_ms = (face_time + hand_time - (time.perf_counter() - start)) * 1000
+            self.overlap_saved_ms = 0.9 * self.overlap_saved_ms + 0.1 * saved_ms
+        else:
+            face_result, face_time = self._timed(self._run_face, mp_image, ts)
+            if hand_image:
+                hand_result, hand_time = self._timed(self._run_hand, hand_image, ts)
+        METRICS.record("face", face_time * 1000)
+        if hand_image:
+            METRICS.record("hand", hand_time * 1000)
+
+        hands = hands_in_frame(hand_result, box, width, height)
+        features = extract_features(face_result, hands)
+        self._remember(face_result, features)
+        return self._timed_decide(frame_start, features, thresholds, enabled_dict, min_durations, now)
+
+    def _remember(self, face_result, features):
+        self.last_features = features
+        if self.motion_gate:
+            self.motion_gate.observe(face_box(face_result))
+
+    def _reuse_features(self, frame_start, thresholds, enabled_dict, min_durations, now):
+        """ Motion gate said nothing changed: the previous raw scores go through the
+        StableScore bank and hold timers again, so smoothing and timing keep running """
+        if self.running_mode == "LIVE_STREAM":
+            with self._lock:
+                self.latest_action = self._timed_decide(frame_start, self.last_features, thresholds,
+                                                        enabled_dict, min_durations, now, inferred=False)
+            return self.latest_action
+        return self._timed_decide(frame_start, self.last_features, thresholds, enabled_dict, min_durations, now,
+                                  inferred=False)
+
+    @property
+    def scores(self):
+        """ Smoothed score per rule of the last frame """
+        return dict(zip(self.rules.names, self.score_values))
+
+    def _timed_decide(self, frame_start, features, *settings, inferred=True):
+        start = time.perf_counter()
+        action = self.decide(features, *settings)
+        end = time.perf_counter()
+        METRICS.record("decide", (end - start) * 1000)
+        METRICS.record("frame", (end - frame_start) * 1000)
+        if inferred:
+            METRICS.record("inferred", (end - frame_start) * 1000)
+        return action
+
+    def _run_face(self, mp_image, ts):
+        if ts is None: return self.face_detector.detect(mp_image)
+        return self.face_detector.detect_for_video(mp_image, ts)
+
+    def _run_hand(self, mp_image, ts):
+        if ts is None: return self.hand_detector.detect(mp_image)
+        return self.hand_detector.detect_for_video(mp_image, ts)
+
+    @staticmethod
+    def _timed(fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+
+    def _on_face_result(self, result, output_image, timestamp_ms):
+        self._stream_result(timestamp_ms, 0, result)
+
+    def _on_hand_result(self, result, output_image, timestamp_ms):
+        self._stream_result(timestamp_ms, 1, result)
+
+    def _stream_result(self, timestamp_ms, slot, result):
+        """ Pairs face/hand callbacks of one frame, then runs the decision logic """
+        with self._lock:
+            entry = self._pending.get(timestamp_ms)
+            if entry is None:
+                return
+            entry[slot] = result
+            # Async models: submit -> callback
+            METRICS.record("hand" if slot else "face", (time.perf_counter() - entry[6]) * 1000)
+            if entry[0] is _MISSING or entry[1] is _MISSING:
+                return
+            # Older frames still waiting were dropped by MediaPipe
+            for ts in [t for t in self._pending if t <= timestamp_ms]:
+                del self._pending[ts]
+            face_result, hand_result, box, width, height, settings, frame_start = entry
+            hands = hands_in_frame(hand_result, box, width, height)
+            features = extract_features(face_result, hands)
+            self._remember(face_result, features)
+            action = self._timed_decide(frame_start, features, *settings)
+            self.latest_action = action
+
+        if self.on_action:
+            self.on_action(action, timestamp_ms)
+
+    def decide(self, features, thresholds, enabled_dict, min_durations, now=None):
+        """ features: FrameFeatures of the frame, or None without a face.
+        now: clock for the hold timers (defaults to time.time(), replay passes media time) """
+        if now is None: now = time.time()
+        if self.recorder:
+            self.recorder.append(now, features)
+
+        rules = self.rules
+        names = rules.names
+        values = [0.0] * len(names)
         physical_action = "NEUTRAL"
+        if features is not None:
+            closest = hand_chin_distance(features)
+            self.hand_scheduler.observe((features.chin.x, features.chin.y), closest)
+            raw = rules.evaluate(rule_inputs(features, closest))
 
-        if face_result.face_landmarks and face_result.face_blendshapes:
-            landmarks = face_result.face_landmarks[0]
-            s = {b.category_name: b.score for b in face_result.face_blendshapes[0]}
-            
-            raw_brow_down = max(s.get('browDownLeft', 0), s.get('browDownRight', 0))
-            raw_brow_up = s.get('browInnerUp', 0)
-            raw_smile = (s.get('mouthSmileLeft', 0) + s.get('mouthSmileRight', 0)) / 2
-            
-            left_eye_y = landmarks[33].y
-            right_eye_y = landmarks[263].y
-            raw_tilt = abs(left_eye_y - right_eye_y) * 5.0
-
-            raw_thinking = 0.0
-            if hand_result and hand_result.hand_landmarks:
-                chin = landmarks[152]
-                for hand in hand_result.hand_landmarks:
-                    index_tip = hand[8]
-                    thumb_tip = hand[4]
-                    dist_index = math.sqrt((chin.x - index_tip.x)**2 + (chin.y - index_tip.y)**2)
-                    dist_thumb = math.sqrt((chin.x - thumb_tip.x)**2 + (chin.y - thumb_tip.y)**2)
-                    min_dist = min(dist_index, dist_thumb)
-                    if min_dist < 0.20:
-                        raw_thinking = max(raw_thinking, (0.20 - min_dist) * 5.0)
-
-            # CALCULATION OF STATES
-            is_thinking = False
-            if enabled_dict.get("THINKING", True) and self.has_hand_model:
-                is_thinking, _ = self.stables["THINKING"].update(raw_thinking, thresholds['THINKING'], thresholds['THINKING'] - 0.15)
-
-            is_malicious = False
-            if enabled_dict.get("MALICIOUS", True):
-                raw_malicious = (raw_brow_down + raw_smile) / 2
-                if raw_brow_down < 0.25 or raw_smile < 0.25: raw_malicious = 0
-                is_malicious, _ = self.stables["MALICIOUS"].update(raw_malicious, thresholds['MALICIOUS'], thresholds['MALICIOUS'] - 0.15)
-
-            is_winking = False
-            if enabled_dict.get("WINK", True) and not is_malicious:
-                raw_wink = abs(s.get('eyeBlinkLeft', 0) - s.get('eyeBlinkRight', 0))
-                is_winking, _ = self.stables["WINK"].update(raw_wink, thresholds['WINK'], thresholds['WINK'] - 0.15)
-
-            is_tilting = False
-            if enabled_dict.get("TILT", True) and not is_malicious and not is_winking:
-                is_tilting, _ = self.stables["TILT"].update(raw_tilt, thresholds['TILT'], thresholds['TILT'] - 0.10)
-
-            is_frowning = False
-            if enabled_dict.get("FROWN", True) and not is_malicious and not is_winking:
-                frown_score = raw_brow_down
-                if raw_brow_up > 0.4: frown_score = 0 
-                is_frowning, _ = self.stables["FROWN"].update(frown_score, thresholds['FROWN'], thresholds['FROWN'] - 0.15)
-
-            is_raising = False
-            if enabled_dict.get("RAISE", True) and not is_tilting:
-                is_raising, _ = self.stables["RAISE"].update(raw_brow_up, thresholds['RAISE'], thresholds['RAISE'] - 0.15)
-
-            is_smiling = False
-            if enabled_dict.get("SMILE", True) and not is_malicious and not is_winking and not is_tilting:
-                is_smiling, _ = self.stables["SMILE"].update(raw_smile, thresholds['SMILE'], thresholds['SMILE'] - 0.15)
-
-            if is_thinking: physical_action = "THINKING"
-            elif is_malicious: physical_action = "MALICIOUS"
-            elif is_winking: physical_action = "WINK"
-            elif is_tilting: physical_action = "TILT"
-            elif is_frowning: physical_action = "FROWN"
-            elif is_raising: physical_action = "RAISE"
-            elif is_smiling: physical_action = "SMILE"
+            # Suppressors are evaluated first; a suppressed or disabled rule keeps its history untouched
+            states = [False] * len(names)
+            active = states.__getitem__
+            for i, suppressors, requires_hands in rules.order:
+                act = names[i]
+                if not enabled_dict.get(act, True) or (requires_hands and not self.has_hand_model):
+                    continue
+                if suppressors and any(map(active, suppressors)):
+                    continue
+                high = thresholds[act]
+                states[i], values[i] = self.stables.update(act, raw[i], high, high - self.hysteresis[act])
+            if True in states:
+                physical_action = names[states.index(True)]
+        else:
+            self.hand_scheduler.observe(None, float("inf"))
+        # Smoothed score per rule this frame (0 when not evaluated), for avatar parameters
+        self.score_values = values
 
-        now = time.time()
         if self.current_action != "NEUTRAL" and now < self.unlock_time:
             return self.current_action
         
@@ -189,21 +973,527 @@ class EmotionDetector:
         
         return self.current_action
 
+    def decide_batch(self, columns, times, thresholds, enabled_dict, min_durations):
+        """ decide() over N recorded frames as array operations.
+        columns: name -> (N,) arrays in the trace layout (present, blendshapes, landmarks, hand tips).
+        Continues from and updates this detector's state, including current_action.
+        Returns the action of every frame as an index into self.actions """
+        times = np.asarray(times, dtype=np.float64)
+        present = np.asarray(columns["present"]) > 0
+        rules = self.rules
+        raw = rules.evaluate_columns(rule_input_columns(columns), len(present))
+
+        # Same suppression as decide(), stage by stage: a rule only sees the frames its suppressors left
+        states = np.zeros(raw.shape, dtype=bool)
+        for stage in rules.levels:
+            for i, suppressors, requires_hands in stage:
+                act = rules.names[i]
+                if not enabled_dict.get(act, True) or (requires_hands and not self.has_hand_model):
+                    continue
+                mask = present & ~states[list(suppressors)].any(axis=0) if suppressors else present
+                high = thresholds[act]
+                states[i], _ = self.stables.update_column(act, raw[i], high, high - self.hysteresis[act], mask)
+
+        physical = np.where(states.any(axis=0), states.argmax(axis=0) + 1, 0)
+        return self._hold_batch(physical, times, min_durations)
+
+    def _hold_batch(self, physical, times, min_durations):
+        """ Hold timers of decide(), visiting only the frames where the action changes """
+        n = len(physical)
+        actions = np.empty(n, dtype=np.int64)
+        actions_list = self.actions
+        current = actions_list.index(self.current_action)
+        unlock = self.unlock_time
+
+        # next_change[c][i]: first frame >= i whose physical action is not c
+        next_change = {}
+        positions = np.arange(n)
+        for c in set(physical.tolist()) | {current}:
+            idx = np.where(physical != c, positions, n)
+            next_change[c] = np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+        i = 0
+        while i < n:
+            if current != 0 and times[i] < unlock:
+                j = max(i + 1, int(np.searchsorted(times, unlock, side="left")))
+                actions[i:j] = current
+                i = j
+                continue
+            k = int(next_change[current][i])
+            actions[i:k] = current
+            if k >= n:
+                break
+            current = int(physical[k])
+            actions[k] = current
+            if current != 0:
+                unlock = times[k] + float(min_durations.get(actions_list[current], 0.0))
+            i = k + 1
+
+        self.current_action = actions_list[current]
+        self.unlock_time = unlock
+        return actions
+
+# --- GOVERNOR ---
+def system_cpu_times():
+    """ (idle, total) CPU time of the whole machine, in consistent units, or None if unknown """
+    if sys.platform == "win32":
+        import ctypes
+        idle, kernel, user = ctypes.c_ulonglong(), ctypes.c_ulonglong(), ctypes.c_ulonglong()
+        if ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+            return idle.value, kernel.value + user.value  # kernel time includes idle time
+        return None
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(v) for v in f.readline().split()[1:9]]
+        return fields[3] + fields[4], sum(fields)
+    except (OSError, ValueError):
+        return None
+
+class Governor:
+    """ Keeps inference inside a CPU share and a latency budget. The camera is set up once
+    (resolution, fps); at runtime the governor steps through quality levels of
+    (inference width, inference rate), cutting rate before resolution """
+    def __init__(self, settings, check_interval=2.0):
+        self.settings = settings
+        self.check_interval = check_interval
+        self.levels = self._build_levels()
+        self.level = min(int(settings.get("level", 0)), len(self.levels) - 1)
+        self.capture = None
+        self.cpu = 0.0
+        self.p95 = 0.0
+        self.calm_checks = 0
+        self.last_admit = 0.0
+        self.buffer = None
+        self.next_check = time.perf_counter() + check_interval
+        self.cpu_sample = self._sample_cpu()
+
+    def _build_levels(self, fps=None):
+        """ (width, rate) per level, every level cheaper than the one before. fps: what the
+        camera delivers; no rate is above it, min_inference_fps included """
+        width = int(self.settings["inference_width"])
+        min_width = int(self.settings.get("min_inference_width", width))
+        fps = float(self.settings["capture_fps"] if fps is None else fps)
+        min_fps = min(float(self.settings.get("min_inference_fps", fps)), fps)
+        widths = list(dict.fromkeys(w for w in (width, int(width * 0.75), width // 2) if w >= min_width)) or [width]
+        rates = [r for r in (fps, fps * 0.75, fps / 2) if r > min_fps] + [min_fps]
+        levels = [(widths[0], rates[0])]
+        wi = ri = 0
+        while wi < len(widths) - 1 or ri < len(rates) - 1:
+            if ri <= wi and ri < len(rates) - 1 or wi == len(widths) - 1:
+                ri += 1
+            else:
+                wi += 1
+            levels.append((widths[wi], rates[ri]))
+        return levels
+
+    @property
+    def inference_width(self):
+        return self.levels[self.level][0]
+
+    @property
+    def inference_fps(self):
+        return self.levels[self.level][1]
+
+    def configure_capture(self, cap):
+        """ Asks the camera for the configured mode and records what it actually delivers """
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.settings["capture_width"])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.settings["capture_height"])
+        cap.set(cv2.CAP_PROP_FPS, self.settings["capture_fps"])
+        self.capture = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                        cap.get(cv2.CAP_PROP_FPS) or float(self.settings["capture_fps"]))
+        if self.capture[2] < float(self.settings["capture_fps"]):
+            # Slower camera than asked for: no level may target rates it cannot deliver
+            self.levels = self._build_levels(self.capture[2])
+            self.level = min(self.level, len(self.levels) - 1)
+
+    def admit(self, now=None):
+        """ Rate cap: True when this frame should be inferred. Frames in between are skipped
+        evenly instead of piling up behind a slow model """
+        now = time.perf_counter() if now is None else now
+        if now - self.last_admit < 0.9 / self.inference_fps:
+            return False
+        self.last_admit = now
+        return True
+
+    def prepare(self, frame):
+        """ Frame scaled down to the inference width (reused buffer), or the frame itself """
+        h, w = frame.shape[:2]
+        width = self.inference_width
+        if w <= width:
+            return frame
+        size = (width, max(1, round(h * width / w)))
+        if self.buffer is None or self.buffer.shape[1::-1] != size:
+            self.buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        return cv2.resize(frame, size, dst=self.buffer, interpolation=cv2.INTER_AREA)
+
+    def _sample_cpu(self):
+        return time.perf_counter(), time.process_time(), system_cpu_times()
+
+    def update(self, now=None):
+        """ Called regularly from the UI loop; returns True when the level changed """
+        now = time.perf_counter() if now is None else now
+        if now < self.next_check:
+            return False
+        last_check = self.next_check - self.check_interval
+        self.next_check = now + self.check_interval
+
+        wall0, proc0, sys0 = self.cpu_sample
+        self.cpu_sample = wall1, proc1, sys1 = self._sample_cpu()
+        if sys0 and sys1 and sys1[1] > sys0[1]:
+            # Whole machine, so an encoding OBS counts against the budget too
+            self.cpu = 1.0 - (sys1[0] - sys0[0]) / (sys1[1] - sys0[1])
+        elif wall1 > wall0:
+            self.cpu = (proc1 - proc0) / ((wall1 - wall0) * (os.cpu_count() or 1))
+        # Only frames inferred since the last check (the level may have changed there);
+        # older samples would keep pushing the level down, reused frames would hide slow ones
+        recent = METRICS.recent("inferred", last_check)
+        self.p95 = float(np.percentile(recent, 95)) if len(recent) else 0.0
+
+        target = float(self.settings["target_cpu"])
+        budget = float(self.settings["latency_budget_ms"])
+        if (self.cpu > target or self.p95 > budget) and self.level < len(self.levels) - 1:
+            self.level += 1
+            self.calm_checks = 0
+            return True
+        # Step back up only after a few calm checks, so the level does not oscillate
+        if self.cpu < target * 0.7 and self.p95 < budget * 0.7 and self.level > 0:
+            self.calm_checks += 1
+            if self.calm_checks >= 3:
+                self.level -= 1
+                self.calm_checks = 0
+                return True
+        else:
+            self.calm_checks = 0
+        return False
+
+    def describe(self):
+        capture = f"{self.capture[0]}x{self.capture[1]}@{self.capture[2]:.0f}" if self.capture else "--"
+        return (f"Camera {capture} | level {self.level}: {self.inference_width}px @ {self.inference_fps:.0f} fps | "
+                f"CPU {self.cpu:.0%}/{float(self.settings['target_cpu']):.0%} | "
+                f"p95 {self.p95:.0f}/{float(self.settings['latency_budget_ms']):.0f} ms")
+
+# --- THREADED PIPELINE ---
+def put_latest(slot, item):
+    """ Single-slot hand-off: the newest item replaces a stale one.
+    Returns True when a stale item was dropped """
+    dropped = False
+    while True:
+        try:
+            slot.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                slot.get_nowait()
+                dropped = True
+            except queue.Empty: pass
+
+def publish_result(bus, frame, action, detector=None):
+    """ Frame to the shared-memory bus, with the detector's result when it ran on this frame.
+    False when the bus failed (e.g. its segment could not be recreated): it is closed then,
+    and the caller drops it so detection goes on without it """
+    try:
+        with METRICS.time("publish"):
+            if detector is None:
+                bus.publish(frame, action)
+            else:
+                bus.publish(frame, action, detector.last_features, detector.score_values,
+                            not detector.last_inference_skipped)
+    except (OSError, ValueError) as e:
+        print(f"Shared-memory bus stopped: {e}")
+        bus.close()
+        return False
+    return True
+
+class CapturePipeline:
+    """ Capture thread -> inference worker -> Tk loop, latest frame wins """
+    def __init__(self, detector, dispatcher, governor=None, bus=None):
+        self.detector = detector
+        self.dispatcher = dispatcher
+        self.governor = governor
+        self.bus = bus
+        self.frames = queue.Queue(maxsize=1)
+        self.results = queue.Queue(maxsize=1)
+        self.settings = None  # Settings snapshot, replaced (never mutated) by the UI thread
+        self.threads = []
+
+    def start(self):
+        self.threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._inference_loop, daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        """ Waits up to 2 s per thread. The capture thread releases the camera itself when it
+        leaves read(), so a slow read never races a release from this thread """
+        for t in self.threads:
+            t.join(timeout=2.0)
+        self.threads = []
+        for slot in (self.frames, self.results):
+            try: slot.get_nowait()
+            except queue.Empty: pass
+
+    def poll(self):
+        try: return self.results.get_nowait()
+        except queue.Empty: return None
+
+    def _capture_loop(self):
+        cap = self.detector.cap
+        try:
+            while self.detector.running:
+                with METRICS.time("capture"):
+                    ret, frame = cap.read()
+                if not ret:
+                    time.sleep(0.01)
+                    continue
+                if put_latest(self.frames, frame):
+                    METRICS.count("frames_dropped")
+        finally:
+            cap.release()
+
+    def _inference_loop(self):
+        while self.detector.running:
+            try: frame = self.frames.get(timeout=0.1)
+            except queue.Empty: continue
+            settings = self.settings
+            if settings is None: continue
+            if self.governor and not self.governor.admit():
+                # Over the rate budget: the frame is still previewed, not inferred
+                if self.bus and not publish_result(self.bus, frame, self.detector.current_action):
+                    self.bus = None
+                put_latest(self.results, (frame, self.detector.current_action))
+                continue
+            image = self.governor.prepare(frame) if self.governor else frame
+            action = self.detector.detect(image, *settings.detect_args)
+            if action != self.detector.current_action:
+                self.dispatcher.submit(action)
+            self.dispatcher.submit_scores(self.detector.scores)
+            self.detector.current_action = action
+            if self.bus and not publish_result(self.bus, frame, action, self.detector):
+                self.bus = None
+            if put_latest(self.results, (frame, action)):
+                METRICS.count("results_dropped")
+
+# --- KEY OUTPUT ---
+class OutputBackend:
+    """ Destination of the actions; called only from the dispatcher thread """
+    def send(self, action, key):
+        raise NotImplementedError
+
+    def send_scores(self, scores):
+        """ Continuous smoothed scores of one frame; ignored by key-based outputs """
+        pass
+
+    def close(self):
+        pass
+
+class PyAutoGuiBackend(OutputBackend):
+    def send(self, action, key):
+        load_heavy_modules()
+        if key and pyautogui:
+            # No PAUSE sleep after the press: the dispatcher paces itself
+            pyautogui.press(key, _pause=False)
+
+class KeyDispatcher:
+    """ Sends actions (and optionally per-frame scores) from its own thread.
+    Anything still waiting when a newer value arrives is dropped, so only the
+    latest target state is sent """
+    def __init__(self, backend, keys=None, stream_scores=False):
+        self.backend = backend
+        self.keys = dict(keys or {})
+        self.stream_scores = stream_scores
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending_action = None
+        self.pending_scores = None
+        self.closing = False
+        self.sent = 0
+        self.coalesced = 0
+        self.last_latency_ms = 0.0
+        self.avg_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, action, key=None):
+        """ Non-blocking. key defaults to the mapping in self.keys at submit time """
+        if key is None:
+            key = self.keys.get(action, "")
+        with self.lock:
+            if self.pending_action is not None:
+                self.coalesced += 1
+            self.pending_action = (action, key, time.perf_counter())
+        self.wake.set()
+
+    def submit_scores(self, scores):
+        if not self.stream_scores:
+            return
+        with self.lock:
+            self.pending_scores = dict(scores)
+        self.wake.set()
+
+    def close(self):
+        self.closing = True
+        self.wake.set()
+        self.thread.join(timeout=2.0)
+        self.backend.close()
+
+    def _run(self):
+        while not self.closing:
+            self.wake.wait()
+            with self.lock:
+                self.wake.clear()
+                pending, self.pending_action = self.pending_action, None
+                scores, self.pending_scores = self.pending_scores, None
+            if self.closing:
+                break
+            # One batch per wake-up: state change first, then the frame's scores
+            if pending:
+                self._send_action(*pending)
+            if scores is not None:
+                try: self.backend.send_scores(scores)
+                except Exception as e: print(f"Output error (scores): {e}")
+
+    def _send_action(self, action, key, decided):
+        try:
+            self.backend.send(action, key)
+        except Exception as e:
+            print(f"Output error ({action}): {e}")
+            return
+        latency = (time.perf_counter() - decided) * 1000
+        METRICS.record("dispatch", latency)
+        self.sent += 1
+        self.last_latency_ms = latency
+        self.avg_latency_ms = latency if self.sent == 1 else 0.9 * self.avg_latency_ms + 0.1 * latency
+        self.max_latency_ms = max(self.max_latency_ms, latency)
+        if key:
+            print(f"Action: {action} -> {key} ({latency:.1f} ms)")
+
+def create_dispatcher(config):
+    """ Key presses by default; the avatar WebSocket API when enabled, with keys as fallback """
+    ws = config['websocket']
+    backend = PyAutoGuiBackend()
+    if ws.get("enabled"):
+        backend = WebSocketBackend(ws, fallback=backend)
+    return KeyDispatcher(backend, config['keys'], stream_scores=ws.get("enabled") and ws.get("stream_scores", False))
+
+# --- PREVIEW ---
+ACTION_COLORS = {
+    "NEUTRAL": "#00FF00", "MALICIOUS": "#A020F0", 
+    "FROWN": "#FF0000", "RAISE": "#FFFF00", 
+    "SMILE": "#00FFFF", "TILT": "#FF1493",
+    "WINK": "#FFA500", "THINKING": "#1E90FF"
+}
+
+class PreviewRenderer:
+    """ Draws the camera preview on a canvas with a fixed set of items updated in place.
+    Resize and colour conversion write into preallocated buffers, and the PhotoImage is
+    only recreated when the preview size changes """
+    def __init__(self, canvas, max_fps=30):
+        self.canvas = canvas
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.size = (canvas.winfo_width(), canvas.winfo_height())
+        self.image_item = canvas.create_image(0, 0, anchor=tk.NW, state=tk.HIDDEN)
+        self.hand_item = canvas.create_text(20, 20, text="HAND DETECTED", fill="cyan", anchor="nw", state=tk.HIDDEN)
+        self.message_item = canvas.create_text(0, 0, text="", fill="gray", font=("Arial", 14), state=tk.HIDDEN)
+        self.stats_item = canvas.create_text(0, 10, text="", fill="white", font=("Courier", 9), anchor="ne",
+                                             justify=tk.LEFT, state=tk.HIDDEN)
+        self.message = None
+        self.photo = None
+        self.photo_size = None
+        self.resized = None
+        self.rgb = None
+        self.last_render = 0.0
+        self.render_cost = 0.0
+        self.rendered = 0
+        self.skipped = 0
+        canvas.bind("<Configure>", self._on_configure)
+
+    def _on_configure(self, event):
+        self.size = (event.width, event.height)
+        self.canvas.coords(self.message_item, event.width // 2, event.height // 2)
+        self.canvas.coords(self.stats_item, event.width - 10, 10)
+
+    def _buffers(self, w, h):
+        if self.photo_size != (w, h):
+            self.resized = np.empty((h, w, 3), dtype=np.uint8)
+            self.rgb = np.empty((h, w, 3), dtype=np.uint8)
+            self.photo = PIL.ImageTk.PhotoImage("RGB", (w, h))
+            self.photo_size = (w, h)
+            self.canvas.itemconfig(self.image_item, image=self.photo)
+
+    def render(self, frame, hand_detected=False):
+        """ Returns False when the frame was skipped by the fps cap or because Tk is behind """
+        now = time.perf_counter()
+        # Rendering slower than the cap means Tk is falling behind: back off to twice the render cost
+        if now - self.last_render < max(self.min_interval, 2 * self.render_cost):
+            self.skipped += 1
+            METRICS.count("renders_skipped")
+            return False
+        cw, ch = self.size
+        if cw <= 10 or ch <= 10:
+            return False
+        h, w = frame.shape[:2]
+        scale = min(cw / w, ch / h)
+        new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        self._buffers(new_w, new_h)
+
+        # Resize the BGR frame first so only preview-sized pixels get converted
+        cv2.resize(frame, (new_w, new_h), dst=self.resized)
+        cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        self.photo.paste(PIL.Image.frombuffer("RGB", (new_w, new_h), self.rgb, "raw", "RGB", 0, 1))
+        self.canvas.coords(self.image_item, (cw - new_w) // 2, (ch - new_h) // 2)
+        self.canvas.itemconfig(self.image_item, state=tk.NORMAL)
+        self.canvas.itemconfig(self.hand_item, state=tk.NORMAL if hand_detected else tk.HIDDEN)
+        if self.message is not None:
+            self.canvas.itemconfig(self.message_item, state=tk.HIDDEN)
+            self.message = None
+
+        self.last_render = time.perf_counter()
+        cost = self.last_render - now
+        METRICS.record("render", cost * 1000)
+        self.render_cost = cost if not self.rendered else 0.9 * self.render_cost + 0.1 * cost
+        self.rendered += 1
+        return True
+
+    def show_stats(self, text):
+        """ Latency overlay; None hides it """
+        if text is None:
+            self.canvas.itemconfig(self.stats_item, state=tk.HIDDEN)
+        else:
+            self.canvas.itemconfig(self.stats_item, text=text, state=tk.NORMAL)
+            self.canvas.tag_raise(self.stats_item)
+
+    def show_message(self, text):
+        if self.message == text:
+            return
+        self.message = text
+        self.canvas.itemconfig(self.image_item, state=tk.HIDDEN)
+        self.canvas.itemconfig(self.hand_item, state=tk.HIDDEN)
+        self.canvas.itemconfig(self.message_item, text=text, state=tk.NORMAL)
+
+    def clear(self):
+        self.message = None
+        for item in (self.image_item, self.hand_item, self.message_item, self.stats_item):
+            self.canvas.itemconfig(item, state=tk.HIDDEN)
+
 # --- CONFIG WIZARD WINDOW ---
-class SetupWizard(tk.Toplevel):
-    def __init__(self, parent, config):
-        super().__init__(parent)
-        self.title("Key Calibration Assistant")
-        self.geometry("500x500")
+class SetupWizard:
+    def __init__(self, parent, config, dispatcher):
+        self.top = tk.Toplevel(parent)
+        self.top.title("Key Calibration Assistant")
+        self.top.geometry("500x500")
         self.config = config
         self.parent = parent
+        self.dispatcher = dispatcher
         
-        tk.Label(self, text="Click on 'Send' to simulate the key.\nYou have 3 seconds to click on your Stream software.", 
+        tk.Label(self.top, text="Click on 'Send' to simulate the key.\nYou have 3 seconds to click on your Stream software.", 
                  font=("Arial", 10), bg="#f0f0f0", pady=10).pack(fill="x")
 
         # dropdown menu
-        self.canvas = tk.Canvas(self)
-        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas = tk.Canvas(self.top)
+        self.scrollbar = ttk.Scrollbar(self.top, orient="vertical", command=self.canvas.yview)
         self.scroll_frame = tk.Frame(self.canvas)
         
         self.scroll_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
@@ -218,7 +1508,7 @@ class SetupWizard(tk.Toplevel):
         self.create_row("NEUTRAL", self.config['keys'].get("NEUTRAL", ""))
         
         # 2. other
-        for act in ["SMILE", "FROWN", "RAISE", "MALICIOUS", "TILT", "WINK", "THINKING"]:
+        for act in self.config['rules']:
             self.create_row(act, self.config['keys'].get(act, ""))
 
     def create_row(self, label, key):
@@ -234,24 +1524,21 @@ class SetupWizard(tk.Toplevel):
 
     def send_key_delayed(self, key, btn):
         if not key: return
-        
-        def run():
-            orig_text = btn.cget("text")
-            btn.config(bg="orange", text="3...")
-            time.sleep(1)
-            btn.config(text="2...")
-            time.sleep(1)
-            btn.config(text="1...")
-            time.sleep(1)
-            
-            pyautogui.press(key)
+        orig_text = btn.cget("text")
+        btn.config(bg="orange")
+
+        # Countdown on the Tk thread, the key itself goes through the dispatcher
+        def step(remaining):
+            if remaining > 0:
+                btn.config(text=f"{remaining}...")
+                self.top.after(1000, step, remaining - 1)
+                return
+            self.dispatcher.submit("TEST", key)
             print(f"Simulation key : {key}")
-            
             btn.config(bg="#4CAF50", text="SENT !")
-            time.sleep(1)
-            btn.config(bg="#ddd", text=orig_text)
+            self.top.after(1000, lambda: btn.config(bg="#ddd", text=orig_text))
 
-        threading.Thread(target=run, daemon=True).start()
+        step(3)
 
 # --- MAIN INTERFACE ---
 class App:
@@ -260,9 +1547,28 @@ class App:
         self.window.title(window_title)
         self.window.geometry("1100x750")
 
-        self.detector = EmotionDetector()
-        self.video_source = 0
         self.load_config()
+        self.video_source = self.config.get("video_source", 0)
+        # Models load in the background (see start_loading), START is enabled once they are ready
+        self.detector = EmotionDetector(parallel=self.config.get("parallel_inference", True),
+                                        load_models=False, rules=self.config,
+                                        motion_gate=self.config['motion_gate'],
+                                        windows=self.config['windows'],
+                                        hysteresis=self.config['hysteresis'])
+        self.startup = {}
+        self.loader = None
+        self.load_error = None
+        self.hand_loader = None
+        self.dispatcher = create_dispatcher(self.config)
+        self.writer = ConfigWriter(CONFIG_FILE)
+        self.governor = Governor(self.config['governor']) if self.config['governor'].get("enabled", True) else None
+        self.pipeline = CapturePipeline(self.detector, self.dispatcher, self.governor) if self.config.get("pipeline", True) else None
+        self.bus = None
+        self.shown_action = self.detector.current_action
+        self.status_time = 0
+        self.overlay_time = 0
+        metrics = self.config['metrics']
+        self.exporter = MetricsExporter(metrics['export_path'], metrics.get("export_interval", 5.0)) if metrics.get("export_path") else None
 
         self.left_container = tk.Frame(window, width=400, bg="#f0f0f0")
         self.left_container.pack(side=tk.LEFT, fill=tk.Y, padx=0, pady=0)
@@ -276,8 +1582,8 @@ class App:
         frame_neutral = tk.LabelFrame(self.header_frame, text="Back to Calm (NEUTRAL)", bg="#e6e6e6", pady=5)
         frame_neutral.pack(fill="x", pady=5)
         tk.Label(frame_neutral, text="key:", bg="#e6e6e6").pack(side=tk.LEFT, padx=5)
-        self.entry_neutral = tk.Entry(frame_neutral, width=8)
-        self.entry_neutral.insert(0, self.config['keys'].get("NEUTRAL", "f13"))
+        self.var_neutral = tk.StringVar(value=self.config['keys'].get("NEUTRAL", "f13"))
+        self.entry_neutral = tk.Entry(frame_neutral, width=8, textvariable=self.var_neutral)
         self.entry_neutral.pack(side=tk.LEFT, padx=5)
 
         # 2. FOOTER
@@ -290,12 +1596,27 @@ class App:
 
         self.var_preview = tk.BooleanVar(value=True)
         tk.Checkbutton(self.footer_frame, text="Show Camera Preview", var=self.var_preview, bg="#f0f0f0").pack(pady=5)
+        self.var_record = tk.BooleanVar(value=self.config.get("record_trace", False))
+        tk.Checkbutton(self.footer_frame, text="Record Session Trace", var=self.var_record, bg="#f0f0f0").pack()
+        self.var_overlay = tk.BooleanVar(value=self.config['metrics'].get("overlay", False))
+        tk.Checkbutton(self.footer_frame, text="Show Latency Overlay", var=self.var_overlay, bg="#f0f0f0").pack()
         self.btn_save = tk.Button(self.footer_frame, text="💾 Save Config", command=self.save_config, bg="#ddd", height=2)
         self.btn_save.pack(pady=5, fill="x")
-        self.btn_start = tk.Button(self.footer_frame, text="▶ START", command=self.toggle_camera, bg="#4CAF50", fg="white", font=("Arial", 12, "bold"), height=2)
+        self.btn_start = tk.Button(self.footer_frame, text="⏳ Loading models...", command=self.toggle_camera, bg="#4CAF50", fg="white", font=("Arial", 12, "bold"), height=2, state=tk.DISABLED)
         self.btn_start.pack(pady=5, fill="x")
-        self.lbl_status = tk.Label(self.footer_frame, text="Status: Stopped", fg="red", bg="#f0f0f0")
+        self.lbl_status = tk.Label(self.footer_frame, text="Status: Loading models...", fg="orange", bg="#f0f0f0")
         self.lbl_status.pack(pady=5)
+        if self.governor:
+            budget_frame = tk.Frame(self.footer_frame, bg="#f0f0f0")
+            budget_frame.pack()
+            tk.Label(budget_frame, text="CPU target %:", bg="#f0f0f0").grid(row=0, column=0, sticky="w")
+            self.var_cpu = tk.StringVar(value=str(round(self.config['governor']['target_cpu'] * 100)))
+            tk.Entry(budget_frame, width=4, textvariable=self.var_cpu).grid(row=0, column=1, padx=5)
+            tk.Label(budget_frame, text="Latency budget ms:", bg="#f0f0f0").grid(row=0, column=2, sticky="w")
+            self.var_budget = tk.StringVar(value=str(self.config['governor']['latency_budget_ms']))
+            tk.Entry(budget_frame, width=4, textvariable=self.var_budget).grid(row=0, column=3, padx=5)
+            self.lbl_governor = tk.Label(self.footer_frame, text="", fg="gray", bg="#f0f0f0", font=("Arial", 8))
+            self.lbl_governor.pack()
 
         # 3. SCROLL
         self.canvas_scroll = tk.Canvas(self.left_container, bg="#f0f0f0", highlightthickness=0)
@@ -309,14 +1630,12 @@ class App:
         self.canvas_scroll.bind_all("<MouseWheel>", self._on_mousewheel)
 
         # 4. LISTE
-        self.sliders = {}
-        self.entries = {}
-        self.entries_duration = {}
+        self.vars_threshold = {}
+        self.vars_key = {}
+        self.vars_duration = {}
         self.vars_enabled = {}
         
-        actions = ["SMILE", "FROWN", "RAISE", "MALICIOUS", "TILT", "WINK", "THINKING"]
-        
-        for act in actions:
+        for act in self.config['rules']:
             frame = tk.LabelFrame(self.scrollable_frame, bg="#f0f0f0", pady=5)
             frame.pack(fill="x", pady=5, padx=5)
             
@@ -324,7 +1643,7 @@ class App:
             self.vars_enabled[act] = var_enable
             
             title = act
-            if act == "THINKING": title += " (Requires Hands)"
+            if act in self.detector.rules.hand_rules: title += " (Requires Hands)"
             
             chk = tk.Checkbutton(frame, text=title, variable=var_enable, font=("Arial", 10, "bold"), bg="#f0f0f0", anchor="w")
             chk.pack(fill="x", padx=5)
@@ -333,22 +1652,32 @@ class App:
             grid_frame.pack(fill="x", padx=5, pady=2)
 
             tk.Label(grid_frame, text="key:", bg="#f0f0f0").grid(row=0, column=0, sticky="w")
-            entry = tk.Entry(grid_frame, width=6)
-            entry.insert(0, self.config['keys'].get(act, ""))
-            entry.grid(row=0, column=1, padx=5)
-            self.entries[act] = entry
+            self.vars_key[act] = tk.StringVar(value=self.config['keys'].get(act, ""))
+            tk.Entry(grid_frame, width=6, textvariable=self.vars_key[act]).grid(row=0, column=1, padx=5)
 
             tk.Label(grid_frame, text="Hold Duration:", bg="#f0f0f0").grid(row=0, column=2, sticky="w")
-            entry_dur = tk.Entry(grid_frame, width=5)
-            entry_dur.insert(0, str(self.config['min_durations'].get(act, 0.5)))
-            entry_dur.grid(row=0, column=3, padx=5)
-            self.entries_duration[act] = entry_dur
+            self.vars_duration[act] = tk.StringVar(value=str(self.config['min_durations'].get(act, 0.5)))
+            tk.Entry(grid_frame, width=5, textvariable=self.vars_duration[act]).grid(row=0, column=3, padx=5)
 
             tk.Label(frame, text="sensitivity:", bg="#f0f0f0", font=("Arial", 8)).pack(anchor="w", padx=5)
-            slider = tk.Scale(frame, from_=0.0, to=1.0, resolution=0.01, orient=tk.HORIZONTAL, bg="#f0f0f0", length=250)
-            slider.set(self.config['thresholds'].get(act, 0.5))
-            slider.pack(fill="x", padx=5)
-            self.sliders[act] = slider
+            self.vars_threshold[act] = tk.DoubleVar(value=self.config['thresholds'].get(act, 0.5))
+            tk.Scale(frame, from_=0.0, to=1.0, resolution=0.01, orient=tk.HORIZONTAL, bg="#f0f0f0", length=250,
+                     variable=self.vars_threshold[act]).pack(fill="x", padx=5)
+
+        # Workers read self.settings; it is rebuilt only when one of these widgets changes
+        self.settings = Settings.from_config(self.config)
+        for var in [self.var_neutral, *self.vars_threshold.values(), *self.vars_key.values(),
+                    *self.vars_duration.values(), *self.vars_enabled.values()]:
+            var.trace_add("write", self.on_settings_changed)
+        for var in (self.var_record, self.var_overlay):
+            var.trace_add("write", lambda *_: self.save_config_silent())
+        if self.governor:
+            for var in (self.var_cpu, self.var_budget):
+                var.trace_add("write", self.on_budget_changed)
+        self.show_preview = self.var_preview.get()
+        self.show_overlay = self.var_overlay.get()
+        self.var_preview.trace_add("write", lambda *_: setattr(self, "show_preview", self.var_preview.get()))
+        self.var_overlay.trace_add("write", lambda *_: setattr(self, "show_overlay", self.var_overlay.get()))
 
         self.right_frame = tk.Frame(window, bg="black")
         self.right_frame.pack(side=tk.RIGHT, expand=True, fill=tk.BOTH, padx=10, pady=10)
@@ -356,7 +1685,10 @@ class App:
         self.lbl_current_action.pack(side=tk.TOP, fill="x", pady=5)
         self.canvas = tk.Canvas(self.right_frame, bg="#222")
         self.canvas.pack(expand=True, fill="both")
+        self.preview = PreviewRenderer(self.canvas, self.config.get("preview_fps", 30))
         self.delay = 15
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.start_loading()
         self.update()
 
     def _on_mousewheel(self, event):
@@ -364,133 +1696,227 @@ class App:
 
     def open_wizard(self):
         self.save_config_silent()
-        SetupWizard(self.window, self.config)
+        SetupWizard(self.window, self.config, self.dispatcher)
 
-    def load_config(self):
-        default = {
-            "keys": {
-                "NEUTRAL": "f13", "SMILE": "f14", "FROWN": "f15", 
-                "RAISE": "f16", "MALICIOUS": "f17", "TILT": "f18", 
-                "WINK": "f19", "THINKING": "f20"
-            },
-            "thresholds": {
-                "SMILE": 0.5, "FROWN": 0.4, "RAISE": 0.5, 
-                "MALICIOUS": 0.7, "TILT": 0.3, "WINK": 0.2, "THINKING": 0.6
-            },
-            "enabled": {
-                "SMILE": True, "FROWN": True, "RAISE": True, 
-                "MALICIOUS": True, "TILT": True, "WINK": True, "THINKING": True
-            },
-            "min_durations": {
-                "SMILE": 0.5, "FROWN": 0.5, "RAISE": 0.5, 
-                "MALICIOUS": 1.0, "TILT": 0.5, "WINK": 0.2, "THINKING": 1.0
-            }
-        }
-        if os.path.exists(CONFIG_FILE):
+    def start_loading(self):
+        """ Heavy imports + landmarker creation on a worker thread; update() picks up the result """
+        def load():
             try:
-                with open(CONFIG_FILE, 'r') as f:
-                    loaded = json.load(f)
-                    self.config = default.copy()
-                    if "keys" in loaded and "HAPPY" in loaded["keys"]:
-                        self.config = default
-                    else:
-                        self.config.update(loaded)
-                        for key in ["keys", "thresholds", "enabled", "min_durations"]:
-                             if key not in self.config: self.config[key] = default[key]
-                             for act in default[key]:
-                                 if act not in self.config[key]: self.config[key][act] = default[key][act]
-            except:
-                self.config = default
-        else:
-            self.config = default
+                self.detector.load_models(self.config.get("running_mode", "VIDEO"),
+                                          hands=hands_needed(self.config))
+            except Exception as e:
+                self.load_error = e
+        self.loader = threading.Thread(target=load, daemon=True)
+        self.loader.start()
+
+    def check_loading(self):
+        if self.loader.is_alive():
+            return
+        self.loader = None
+        if self.load_error:
+            self.lbl_status.config(text="Status: Model loading failed", fg="red")
+            messagebox.showerror("Error", f"Could not load the models:\n{self.load_error}")
+            return
+        self.startup.update(self.detector.timings)
+        self.startup["ready"] = time.perf_counter() - STARTUP_T0
+        print("Startup: " + ", ".join(f"{name} {t:.2f} s" for name, t in self.startup.items()))
+        self.btn_start.config(text="▶ START", state=tk.NORMAL)
+        self.lbl_status.config(text=f"Status: Stopped (ready in {self.startup['ready']:.1f} s)", fg="red")
+
+    def on_close(self):
+        if self.detector.running:
+            self.toggle_camera()
+        if self.exporter:
+            self.exporter.stop()
+        self.dispatcher.close()
+        self.writer.close()
+        self.window.destroy()
+
+    def load_config(self):
+        self.config = load_config_file(CONFIG_FILE)
 
     def save_config_silent(self):
-        """ Saving without displaying popup (useful for the wizard) """
-        self.config['keys']['NEUTRAL'] = self.entry_neutral.get()
-        if 'min_durations' not in self.config: self.config['min_durations'] = {}
-        for act in self.sliders:
-            self.config['thresholds'][act] = self.sliders[act].get()
-            self.config['keys'][act] = self.entries[act].get()
-            self.config['enabled'][act] = self.vars_enabled[act].get()
-            try: val = float(self.entries_duration[act].get())
-            except: val = 0.0
-            self.config['min_durations'][act] = val
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        """ Saving without displaying popup (useful for the wizard). The file is written by
+        the background ConfigWriter, a moment later, once the changes settle """
+        self.settings.apply_to(self.config)
+        self.config['record_trace'] = self.var_record.get()
+        self.config['metrics']['overlay'] = self.var_overlay.get()
+        if self.governor:
+            self.config['governor']['level'] = self.governor.level
+        self.writer.save(self.config)
 
     def save_config(self):
         self.save_config_silent()
+        if not self.writer.flush():
+            reason = f":\n{self.writer.error}" if self.writer.error else " (timed out)"
+            messagebox.showerror("Error", f"Could not save the configuration{reason}")
+            return
         messagebox.showinfo("Info", "Configuration saved !")
 
+    def on_settings_changed(self, *_):
+        """ Widget trace: a new snapshot for the worker threads, then a debounced save """
+        durations = {}
+        for act, var in self.vars_duration.items():
+            try: durations[act] = float(var.get())
+            except ValueError: durations[act] = self.settings.min_durations.get(act, 0.0)  # half-typed: keep the last value
+        thresholds = {}
+        for act, var in self.vars_threshold.items():
+            try: thresholds[act] = float(var.get())
+            except (ValueError, tk.TclError): thresholds[act] = self.settings.thresholds.get(act, 0.5)
+        keys = {act: var.get() for act, var in self.vars_key.items()}
+        keys["NEUTRAL"] = self.var_neutral.get()
+        previous = self.settings
+        self.settings = Settings(thresholds=thresholds, min_durations=durations, keys=keys,
+                                 enabled={act: var.get() for act, var in self.vars_enabled.items()})
+        if any(self.settings.enabled.get(act) and not previous.enabled.get(act)
+               for act in self.detector.rules.hand_rules):
+            self.ensure_hand_model()
+        self.dispatcher.keys = self.settings.keys
+        if self.pipeline:
+            self.pipeline.settings = self.settings
+        self.save_config_silent()
+
+    def ensure_hand_model(self):
+        """ Loads the hand model in the background when a hand rule is enabled and the app
+        started without it. A failed attempt is retried on the next START or toggle """
+        if self.loader or self.detector.hand_detector is not None:
+            return  # still loading everything, or already there
+        if self.hand_loader and self.hand_loader.is_alive():
+            return
+        if not any(self.settings.enabled.get(act, True) for act in self.detector.rules.hand_rules):
+            return
+        self.hand_loader = threading.Thread(target=self._load_hand_model, daemon=True)
+        self.hand_loader.start()
+
+    def _load_hand_model(self):
+        if not self.detector.load_hand_model():
+            print("Hand model could not be loaded")
+        self.hand_loader = None
+
+    def on_budget_changed(self, *_):
+        """ Budget entries -> governor settings (shared with self.config), invalid input ignored """
+        try: self.governor.settings['target_cpu'] = min(1.0, max(0.05, float(self.var_cpu.get()) / 100))
+        except ValueError: pass
+        try: self.governor.settings['latency_budget_ms'] = max(1.0, float(self.var_budget.get()))
+        except ValueError: pass
+        self.save_config_silent()
+
     def toggle_camera(self):
         if self.detector.running:
             self.detector.running = False
-            if self.detector.cap:
+            if self.pipeline:
+                self.pipeline.stop()  # its capture thread releases the camera
+            elif self.detector.cap:
                 self.detector.cap.release()
+            if self.bus:
+                self.bus.close()
+                self.bus = None
+            if self.detector.recorder:
+                self.detector.recorder.close()
+                print(f"Trace saved: {self.detector.recorder.path} ({self.detector.recorder.total} frames)")
+                self.detector.recorder = None
             self.btn_start.config(text="▶ START", bg="#4CAF50")
             self.lbl_status.config(text="Status: Stopped", fg="red")
-            self.canvas.delete("all")
+            self.preview.clear()
         else:
+            if self.var_record.get():
+                os.makedirs(TRACE_DIR, exist_ok=True)
+                path = os.path.join(TRACE_DIR, time.strftime("session-%Y%m%d-%H%M%S.vtrace"))
+                self.detector.recorder = TraceRecorder(path, BLENDSHAPE_NAMES)
+            self.ensure_hand_model()
+            if self.detector.motion_gate:
+                self.detector.motion_gate.reset()
             self.detector.cap = cv2.VideoCapture(self.video_source)
+            if self.governor:
+                self.governor.configure_capture(self.detector.cap)
+                # Poll the results about twice per camera frame
+                self.delay = max(5, int(500 / self.governor.capture[2]))
+            if self.config['shm_bus'].get("enabled"):
+                # Frames segment sized from the camera mode now, so a failure shows here
+                shape = (int(self.detector.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         int(self.detector.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+                try:
+                    self.bus = BusPublisher(self.config['shm_bus'].get("name", "veado"), self.detector.rules.names,
+                                            shape=shape if all(shape) else None)
+                except OSError as e:
+                    print(f"Shared-memory bus unavailable: {e}")
             self.detector.running = True
+            if self.pipeline:
+                self.pipeline.bus = self.bus
+                self.pipeline.settings = self.settings
+                self.pipeline.start()
             self.btn_start.config(text="⏹ STOP", bg="#f44336")
             self.lbl_status.config(text="Status: Running", fg="green")
 
     def update(self):
+        if "window" not in self.startup:
+            self.startup["window"] = time.perf_counter() - STARTUP_T0
+        if self.loader:
+            self.check_loading()
         if self.detector.running and self.detector.cap.isOpened():
-            ret, frame = self.detector.cap.read()
-            if ret:
-                thresholds = {act: s.get() for act, s in self.sliders.items()}
-                enabled_dict = {act: v.get() for act, v in self.vars_enabled.items()}
-                min_durations = {}
-                for act, entry in self.entries_duration.items():
-                    try: min_durations[act] = float(entry.get())
-                    except: min_durations[act] = 0.0
-
-                action = self.detector.detect(frame, thresholds, enabled_dict, min_durations)
-                
-                if action != self.detector.current_action:
-                    key = self.entry_neutral.get() if action == "NEUTRAL" else self.entries.get(action, tk.Entry()).get()
-                    if key:
-                        pyautogui.press(key)
-                        print(f"Action: {action} -> {key}")
-                    
+            result = None
+            if self.pipeline:
+                # Worker threads do capture + inference, this loop only draws
+                result = self.pipeline.poll()
+            else:
+                with METRICS.time("capture"):
+                    ret, frame = self.detector.cap.read()
+                if ret and self.governor and not self.governor.admit():
+                    result = (frame, self.detector.current_action)
+                    if self.bus and not publish_result(self.bus, frame, self.detector.current_action):
+                        self.bus = None
+                elif ret:
+                    image = self.governor.prepare(frame) if self.governor else frame
+                    action = self.detector.detect(image, *self.settings.detect_args)
+                    if action != self.detector.current_action:
+                        self.dispatcher.submit(action)
+                    self.dispatcher.submit_scores(self.detector.scores)
                     self.detector.current_action = action
-                    
-                    color_map = {
-                        "NEUTRAL": "#00FF00", "MALICIOUS": "#A020F0", 
-                        "FROWN": "#FF0000", "RAISE": "#FFFF00", 
-                        "SMILE": "#00FFFF", "TILT": "#FF1493",
-                        "WINK": "#FFA500", "THINKING": "#1E90FF"
-                    }
-                    color = color_map.get(action, "white")
-                    self.lbl_current_action.config(text=f"ACTION : {action}", fg=color)
-
-                if self.var_preview.get():
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    cw = self.canvas.winfo_width()
-                    ch = self.canvas.winfo_height()
-                    h, w, _ = frame.shape
-                    
-                    if cw > 10 and ch > 10:
-                        scale = min(cw/w, ch/h)
-                        new_w, new_h = int(w*scale), int(h*scale)
-                        frame = cv2.resize(frame, (new_w, new_h))
-                        self.photo = PIL.ImageTk.PhotoImage(image=PIL.Image.fromarray(frame))
-                        self.canvas.create_image((cw - new_w)//2, (ch - new_h)//2, image=self.photo, anchor=tk.NW)
-                    
-                    if self.detector.has_hand_model and action == "THINKING":
-                        self.canvas.create_text(20, 20, text="HAND DETECTED", fill="cyan", anchor="nw")
-
-                else:
-                    if len(self.canvas.find_all()) > 1:
-                         self.canvas.delete("all")
-                         self.canvas.create_text(self.canvas.winfo_width()//2, self.canvas.winfo_height()//2, 
-                                               text="MONITORING ACTIVE\n(Preview disabled)", fill="gray", font=("Arial", 14))
+                    if self.bus and not publish_result(self.bus, frame, action, self.detector):
+                        self.bus = None
+                    result = (frame, action)
+            if result:
+                self.show_result(*result)
+            if self.governor and self.governor.update():
+                print(f"Governor: {self.governor.describe()}")
 
         self.window.after(self.delay, self.update)
 
+    def show_result(self, frame, action):
+        now = time.time()
+        if now - self.status_time > 1.0:
+            self.status_time = now
+            status = f"Status: Running | key {self.dispatcher.avg_latency_ms:.1f} ms"
+            if self.detector.pool:
+                status += f" | overlap saved {self.detector.overlap_saved_ms:.1f} ms"
+            gate = self.detector.motion_gate
+            if gate and gate.checked:
+                status += f" | reused {gate.skipped / gate.checked:.0%}"
+            self.lbl_status.config(text=status)
+            if self.governor:
+                self.lbl_governor.config(text=self.governor.describe())
+
+        if action != self.shown_action:
+            self.shown_action = action
+            color = ACTION_COLORS.get(action, "white")
+            self.lbl_current_action.config(text=f"ACTION : {action}", fg=color)
+
+        if self.show_preview:
+            self.preview.render(frame, self.detector.has_hand_model and action in self.detector.rules.hand_rules)
+            if not self.show_overlay:
+                self.preview.show_stats(None)
+            elif now - self.overlay_time > 0.5:
+                self.overlay_time = now
+                self.preview.show_stats(METRICS.overlay_text())
+        else:
+            self.preview.show_message("MONITORING ACTIVE\n(Preview disabled)")
+
 if __name__ == "__main__":
-    root = tk.Tk()
+    # Child processes of the multi-performer mode start through here in the frozen exe
+    multiprocessing.freeze_support()
+    if "--multi" in sys.argv:
+        from multi import main as multi_main
+        sys.exit(multi_main([a for a in sys.argv[1:] if a != "--multi"]))
+    root = load_tk().Tk()
     app = App(root, "PNGTuber Controller v1.0")
     root.mainloop()
\ No newline at end of file
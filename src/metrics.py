@@ -0,0 +1,162 @@
+""" Per-stage latency metrics: rolling windows with p50/p95/max, rates, JSON / Prometheus text export.
+
+Recording a sample is one lock and one array write, cheap enough to leave on for a whole stream.
+Every module records into the shared METRICS registry:
+
+    with METRICS.time("face"):
+        result = detector.detect(image)
+    METRICS.record("dispatch", latency_ms)
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Pipeline order, used for display and export
+# "inferred" is "frame" restricted to the frames that ran the models (no motion-gate reuse)
+STAGES = ("capture", "gate", "convert", "face", "hand", "decide", "frame", "inferred", "dispatch", "publish", "render")
+
+class StageWindow:
+    """ Last `size` samples of one stage plus lifetime count/sum """
+    def __init__(self, size):
+        self.values = np.zeros(size, dtype=np.float64)
+        self.stamps = np.zeros(size, dtype=np.float64)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def add(self, ms, now):
+        i = self.count % len(self.values)
+        self.values[i] = ms
+        self.stamps[i] = now
+        self.count += 1
+        self.total_ms += ms
+
+    def since(self, t):
+        """ Samples recorded after time t that are still in the window """
+        n = min(self.count, len(self.values))
+        return self.values[:n][self.stamps[:n] > t].copy()
+
+    def summary(self, now, rate_window):
+        n = min(self.count, len(self.values))
+        if not n:
+            return {"count": 0, "rate": 0.0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0, "total_ms": 0.0}
+        values = self.values[:n]
+        p50, p95 = np.percentile(values, [50, 95])
+        recent = self.stamps[:n][self.stamps[:n] > now - rate_window]
+        rate = len(recent) / max(now - recent.min(), 1e-3) if len(recent) > 1 else 0.0
+        return {"count": self.count, "rate": float(rate), "mean": float(values.mean()),
+                "p50": float(p50), "p95": float(p95), "max": float(values.max()), "total_ms": self.total_ms}
+
+class LatencyMetrics:
+    def __init__(self, window=512, rate_window=5.0):
+        self.window = window
+        self.rate_window = rate_window
+        self.enabled = True
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, ms):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            w = self.stages.get(stage)
+            if w is None:
+                w = self.stages[stage] = StageWindow(self.window)
+            w.add(ms, now)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def count(self, name, n=1):
+        """ Event counters (dropped frames, skipped renders...) """
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def recent(self, stage, since):
+        """ Samples of one stage recorded after `since` (a time.perf_counter() value) """
+        with self.lock:
+            w = self.stages.get(stage)
+            return w.since(since) if w else np.zeros(0)
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+
+    def summary(self):
+        now = time.perf_counter()
+        with self.lock:
+            order = [s for s in STAGES if s in self.stages] + sorted(s for s in self.stages if s not in STAGES)
+            stages = {s: self.stages[s].summary(now, self.rate_window) for s in order}
+            return {"time": time.time(), "stages": stages, "counters": dict(self.counters)}
+
+    def overlay_text(self):
+        """ Short multi-line text for the preview overlay """
+        summary = self.summary()["stages"]
+        lines = [f"{summary['frame']['rate']:.1f} fps" if "frame" in summary else "-- fps"]
+        for stage, s in summary.items():
+            lines.append(f"{stage:<8} p50 {s['p50']:5.1f}  p95 {s['p95']:5.1f}  max {s['max']:6.1f} ms")
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix="veado"):
+        summary = self.summary()
+        lines = [f"# HELP {prefix}_stage_latency_ms Per-stage latency over the last {self.window} samples",
+                 f"# TYPE {prefix}_stage_latency_ms summary"]
+        for stage, s in summary["stages"].items():
+            for q, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max")):
+                lines.append(f'{prefix}_stage_latency_ms{{stage="{stage}",quantile="{q}"}} {s[key]:.3f}')
+            lines.append(f'{prefix}_stage_latency_ms_sum{{stage="{stage}"}} {s["total_ms"]:.3f}')
+            lines.append(f'{prefix}_stage_latency_ms_count{{stage="{stage}"}} {s["count"]}')
+        lines.append(f"# TYPE {prefix}_stage_rate gauge")
+        for stage, s in summary["stages"].items():
+            lines.append(f'{prefix}_stage_rate{{stage="{stage}"}} {s["rate"]:.3f}')
+        for name, value in summary["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+METRICS = LatencyMetrics()
+
+# --- EXPORT ---
+def write_metrics(path, metrics=METRICS):
+    """ .prom / .txt -> Prometheus text format, anything else -> JSON. Written atomically """
+    if path.endswith((".prom", ".txt")):
+        text = metrics.to_prometheus()
+    else:
+        text = json.dumps(metrics.summary(), indent=2)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+class MetricsExporter:
+    """ Background thread writing the metrics file every `interval` seconds """
+    def __init__(self, path, interval=5.0, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try: write_metrics(self.path, self.metrics)
+            except OSError as e: print(f"Metrics export failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join(timeout=1.0)
+        try: write_metrics(self.path, self.metrics)
+        except OSError: pass
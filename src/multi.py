@@ -0,0 +1,298 @@
+""" Multi-performer mode: one capture + detector process per performer, one supervisor window.
+
+Each worker process owns its camera (or video file), its EmotionDetector and its key /
+avatar output, so inference runs on separate cores instead of sharing one GIL. Status
+messages come back over a pipe and preview thumbnails through shared memory.
+
+Performers are listed in config.json; every entry overrides the top-level sections:
+
+    "performers": [
+        {"name": "Alice", "source": 0, "keys": {"SMILE": "f14"}},
+        {"name": "Bob", "source": 1, "keys": {"SMILE": "f21"}, "thresholds": {"SMILE": 0.6}}
+    ]
+
+    python multi.py                      # supervisor window
+    python multi.py --sources 0 clip.mp4 # ad-hoc performers with the top-level settings
+    python multi.py --headless --duration 30
+"""
+import sys
+import time
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from main import (CONFIG_FILE, ACTION_COLORS, EmotionDetector, PreviewRenderer, create_dispatcher, hands_needed,
+                  load_config_file, load_heavy_modules, load_tk)
+from metrics import METRICS
+
+THUMB_W, THUMB_H = 320, 240
+STATUS_INTERVAL = 0.5
+
+def performer_config(config, performer, index):
+    """ Top-level config with the performer's sections merged over it """
+    merged = {key: (dict(value) if isinstance(value, dict) else value)
+              for key, value in config.items() if key != "performers"}
+    for key, value in performer.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key].update(value)
+        else:
+            merged[key] = value
+    merged.setdefault("name", f"Performer {index + 1}")
+    merged.setdefault("source", index)
+    return merged
+
+def parse_source(source):
+    """ Camera index or video path """
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+# --- THUMBNAILS ---
+class ThumbnailSlot:
+    """ Letterboxed preview frame in shared memory. The leading uint64 sequence number is odd
+    while the worker writes, so the supervisor can tell a torn copy and drop it """
+    HEADER = 8
+    size = HEADER + THUMB_H * THUMB_W * 3
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.seq = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf)
+        self.pixels = np.ndarray((THUMB_H, THUMB_W, 3), dtype=np.uint8, buffer=shm.buf, offset=self.HEADER)
+        self.scratch = None
+
+    def write(self, frame):
+        h, w = frame.shape[:2]
+        scale = min(THUMB_W / w, THUMB_H / h)
+        new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        if self.scratch is None or self.scratch.shape[:2] != (new_h, new_w):
+            self.scratch = np.empty((new_h, new_w, 3), dtype=np.uint8)
+            self.pixels[:] = 0
+        cv2.resize(frame, (new_w, new_h), dst=self.scratch, interpolation=cv2.INTER_AREA)
+        y, x = (THUMB_H - new_h) // 2, (THUMB_W - new_w) // 2
+        self.seq[0] += 1
+        self.pixels[y:y + new_h, x:x + new_w] = self.scratch
+        self.seq[0] += 1
+
+    def read(self, out, last_seq):
+        """ Copies a newer frame into out; returns its sequence number, or None """
+        seq = int(self.seq[0])
+        if seq == last_seq or seq & 1:
+            return None
+        out[:] = self.pixels
+        return seq if int(self.seq[0]) == seq else None
+
+    def close(self):
+        # Views must go before the mapping can be closed
+        del self.seq, self.pixels
+        self.shm.close()
+
+# --- WORKER PROCESS ---
+def performer_worker(index, config, conn, stop, shm_name):
+    slot = ThumbnailSlot(shared_memory.SharedMemory(name=shm_name))
+    cap = dispatcher = None
+    try:
+        detector = EmotionDetector(running_mode=config.get("running_mode", "VIDEO"),
+                                   parallel=config.get("parallel_inference", True),
+                                   hands=hands_needed(config), rules=config,
+                                   windows=config['windows'], hysteresis=config['hysteresis'],
+                                   motion_gate=config['motion_gate'])
+        source = parse_source(config["source"])
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise IOError(f"cannot open source {source!r}")
+        # Video files are paced to their own frame rate, cameras deliver at theirs
+        is_file = isinstance(source, str)
+        frame_interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0) if is_file else 0.0
+        dispatcher = create_dispatcher(config)
+        settings = (dict(config['thresholds']), dict(config['enabled']), dict(config['min_durations']))
+        conn.send({"index": index, "running": True, "hands": detector.has_hand_model,
+                   "hand_rules": detector.rules.hand_rules})
+
+        status_time = 0.0
+        next_frame = time.perf_counter()
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                if is_file and config.get("loop", True):
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+            action = detector.detect(frame, *settings)
+            if action != detector.current_action:
+                dispatcher.submit(action)
+                detector.current_action = action
+                conn.send({"index": index, "action": action})
+            dispatcher.submit_scores(detector.scores)
+            slot.write(frame)
+
+            now = time.perf_counter()
+            if now - status_time > STATUS_INTERVAL:
+                status_time = now
+                stage = METRICS.summary()["stages"].get("frame", {})
+                conn.send({"index": index, "fps": stage.get("rate", 0.0), "p95": stage.get("p95", 0.0),
+                           "key_ms": dispatcher.avg_latency_ms})
+            if frame_interval:
+                next_frame += frame_interval
+                time.sleep(max(0.0, next_frame - time.perf_counter()))
+    except Exception as e:
+        conn.send({"index": index, "error": str(e)})
+    finally:
+        if cap: cap.release()
+        if dispatcher: dispatcher.close()
+        slot.close()
+        conn.send({"index": index, "running": False})
+        conn.close()
+
+# --- SUPERVISOR ---
+class Supervisor:
+    """ Starts one worker process per performer and collects their state """
+    def __init__(self, config):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.performers = [performer_config(config, p, i) for i, p in enumerate(config.get("performers", []))]
+        self.states = [{"name": p["name"], "action": "NEUTRAL", "fps": 0.0, "p95": 0.0, "key_ms": 0.0,
+                        "running": False, "hands": False, "hand_rules": [], "error": None} for p in self.performers]
+        self.stop_event = self.ctx.Event()
+        self.processes = []
+        self.conns = []
+        self.shms = []
+        self.slots = []
+
+    def start(self):
+        for i, performer in enumerate(self.performers):
+            shm = shared_memory.SharedMemory(create=True, size=ThumbnailSlot.size)
+            reader, writer = self.ctx.Pipe(duplex=False)
+            proc = self.ctx.Process(target=performer_worker, args=(i, performer, writer, self.stop_event, shm.name),
+                                    name=f"performer-{i}", daemon=True)
+            proc.start()
+            writer.close()
+            self.processes.append(proc)
+            self.conns.append(reader)
+            self.shms.append(shm)
+            self.slots.append(ThumbnailSlot(shm))
+
+    def poll(self):
+        """ Applies every pending worker message; returns the indices that changed """
+        changed = set()
+        for conn in self.conns:
+            try:
+                while conn.poll():
+                    message = conn.recv()
+                    i = message.pop("index")
+                    self.states[i].update(message)
+                    changed.add(i)
+            except (EOFError, OSError):
+                continue
+        return changed
+
+    def thumbnail(self, i, out, last_seq):
+        return self.slots[i].read(out, last_seq)
+
+    def stop(self):
+        self.stop_event.set()
+        for proc in self.processes:
+            proc.join(timeout=3.0)
+            if proc.is_alive():
+                proc.terminate()
+        self.poll()
+        for slot, shm in zip(self.slots, self.shms):
+            slot.close()
+            shm.unlink()
+        for conn in self.conns:
+            conn.close()
+        self.processes, self.conns, self.shms, self.slots = [], [], [], []
+
+# --- SUPERVISOR WINDOW ---
+class MultiApp:
+    def __init__(self, window, supervisor, columns=2, preview_fps=30):
+        tk = load_tk()
+        load_heavy_modules()  # PreviewRenderer draws with cv2
+        self.tk = tk
+        self.window = window
+        self.window.title("PNGTuber Controller - Performers")
+        self.window.configure(bg="black")
+        self.supervisor = supervisor
+        self.tiles = []
+        for i, state in enumerate(supervisor.states):
+            frame = tk.Frame(window, bg="black", padx=5, pady=5)
+            frame.grid(row=i // columns, column=i % columns, sticky="nsew")
+            window.grid_columnconfigure(i % columns, weight=1)
+            window.grid_rowconfigure(i // columns, weight=1)
+            title = tk.Label(frame, text=state["name"], font=("Arial", 12, "bold"), bg="black", fg="white")
+            title.pack(fill="x")
+            action = tk.Label(frame, text="starting...", font=("Arial", 16, "bold"), bg="black", fg="gray")
+            action.pack(fill="x")
+            canvas = tk.Canvas(frame, bg="#222", width=THUMB_W, height=THUMB_H, highlightthickness=0)
+            canvas.pack(expand=True, fill="both")
+            status = tk.Label(frame, text="", bg="black", fg="gray", font=("Arial", 9))
+            status.pack(fill="x")
+            self.tiles.append({"action": action, "status": status, "preview": PreviewRenderer(canvas, preview_fps),
+                               "buffer": np.zeros((THUMB_H, THUMB_W, 3), dtype=np.uint8), "seq": -1})
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.delay = 15
+        self.update()
+
+    def update(self):
+        for i in self.supervisor.poll():
+            state, tile = self.supervisor.states[i], self.tiles[i]
+            if state["error"]:
+                tile["action"].config(text="ERROR", fg="red")
+                tile["status"].config(text=state["error"], fg="red")
+                continue
+            tile["action"].config(text=state["action"], fg=ACTION_COLORS.get(state["action"], "white"))
+            tile["status"].config(text=f"{state['fps']:.1f} fps | p95 {state['p95']:.1f} ms | key {state['key_ms']:.1f} ms"
+                                  if state["running"] else "stopped")
+        for i, tile in enumerate(self.tiles):
+            seq = self.supervisor.thumbnail(i, tile["buffer"], tile["seq"])
+            if seq is not None:
+                tile["seq"] = seq
+                state = self.supervisor.states[i]
+                tile["preview"].render(tile["buffer"], state["hands"] and state["action"] in state["hand_rules"])
+        self.window.after(self.delay, self.update)
+
+    def on_close(self):
+        self.supervisor.stop()
+        self.window.destroy()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several performers, one process each.")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--sources", nargs="+", help="cameras / video files, instead of config 'performers'")
+    parser.add_argument("--columns", type=int, default=2)
+    parser.add_argument("--headless", action="store_true", help="no window, print the performer states")
+    parser.add_argument("--duration", type=float, default=None, help="headless: stop after this many seconds")
+    args = parser.parse_args(argv)
+
+    config = load_config_file(args.config)
+    if args.sources:
+        config["performers"] = [{"name": f"Performer {i + 1}", "source": s} for i, s in enumerate(args.sources)]
+    if not config.get("performers"):
+        parser.error("no performers: add a 'performers' list to the config or pass --sources")
+
+    supervisor = Supervisor(config)
+    supervisor.start()
+    if not args.headless:
+        root = load_tk().Tk()
+        MultiApp(root, supervisor, args.columns, config.get("preview_fps", 30))
+        root.mainloop()
+        return 0
+
+    start = time.time()
+    try:
+        while args.duration is None or time.time() - start < args.duration:
+            time.sleep(1.0)
+            supervisor.poll()
+            print(" | ".join(f"{s['name']}: {s['error'] or s['action']} {s['fps']:.1f} fps" for s in supervisor.states))
+            if not any(p.is_alive() for p in supervisor.processes):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
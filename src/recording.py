@@ -0,0 +1,267 @@
+""" Compact per-frame feature traces: record while streaming, replay offline without the models.
+
+File layout (little endian, every section padded to 8 bytes):
+    header : b"VTRC", uint16 version, uint16 reserved, uint32 json length, json {"columns", "block_rows"}
+    blocks : uint32 rows, uint32 reserved, float64 time[rows], float32 column[rows] for each column
+
+Blocks are appended as they fill up, so a crash loses at most the last block.
+
+    python recording.py info traces/session.vtrace
+    python recording.py replay traces/session.vtrace --start 42:00 --end 43:00 --set thresholds.SMILE=0.6
+"""
+import os
+import sys
+import json
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b"VTRC"
+VERSION = 1
+HAND_SLOTS = 2
+LANDMARK_COLUMNS = ["left_eye_y", "right_eye_y", "chin_x", "chin_y"]
+HAND_COLUMNS = [f"hand{h}_{tip}_{axis}" for h in range(HAND_SLOTS) for tip in ("thumb", "index") for axis in ("x", "y")]
+
+def _pad(n):
+    return (-n) % 8
+
+def trace_columns(blendshape_names):
+    return ["present"] + list(blendshape_names) + LANDMARK_COLUMNS + HAND_COLUMNS
+
+# --- WRITER ---
+class TraceRecorder:
+    def __init__(self, path, blendshape_names, block_rows=256):
+        self.path = path
+        self.columns = trace_columns(blendshape_names)
+        self.n_blend = len(blendshape_names)
+        self.block_rows = block_rows
+        self.times = np.zeros(block_rows, dtype=np.float64)
+        self.rows = np.full((block_rows, len(self.columns)), np.nan, dtype=np.float32)
+        self.count = 0
+        self.total = 0
+
+        self.file = open(path, "wb")
+        header = json.dumps({"columns": self.columns, "block_rows": block_rows}).encode("utf-8")
+        self.file.write(MAGIC + struct.pack("<HHI", VERSION, 0, len(header)) + header + b"\0" * _pad(len(header)))
+
+    def append(self, now, features):
+        """ features: FrameFeatures or None when no face was found """
+        row = self.rows[self.count]
+        row[:] = np.nan
+        self.times[self.count] = now
+        if features is None:
+            row[0] = 0.0
+        else:
+            b = 1 + self.n_blend
+            row[0] = 1.0
+            row[1:b] = features.blendshapes
+            row[b:b + 4] = (features.left_eye_y, features.right_eye_y, features.chin.x, features.chin.y)
+            for h, (thumb, index) in enumerate(features.hand_tips[:HAND_SLOTS]):
+                o = b + 4 + h * 4
+                row[o:o + 4] = (thumb.x, thumb.y, index.x, index.y)
+        self.count += 1
+        self.total += 1
+        if self.count == self.block_rows:
+            self.flush()
+
+    def flush(self):
+        n = self.count
+        if not n:
+            return
+        data = np.ascontiguousarray(self.rows[:n].T).tobytes()
+        self.file.write(struct.pack("<II", n, 0) + self.times[:n].tobytes() + data + b"\0" * _pad(len(data)))
+        self.file.flush()
+        self.count = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+# --- READER ---
+class TraceReader:
+    """ Memory-maps a trace. A single-block trace is read in place: times and columns are views
+    of the map. A longer trace has one block per `block_rows` frames (256 by default, ~8.5 s
+    at 30 fps), and column() copies the blocks of the requested column into one array,
+    4 bytes per frame (~430 KB per column per hour at 30 fps). Only requested columns are
+    loaded and each is loaded once; block_views() gives the per-block views without copying """
+    def __init__(self, path):
+        self.path = path
+        self.raw = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+        if bytes(self.raw[:4]) != MAGIC:
+            raise ValueError(f"{path} is not a trace file")
+        version, _, header_len = struct.unpack("<HHI", bytes(self.raw[4:12]))
+        if version != VERSION:
+            raise ValueError(f"Unsupported trace version {version}")
+        header = json.loads(bytes(self.raw[12:12 + header_len]).decode("utf-8"))
+        self.columns = header["columns"]
+        self.index = {name: i for i, name in enumerate(self.columns)}
+
+        self.blocks = []
+        offset = 12 + header_len + _pad(header_len)
+        n_cols = len(self.columns)
+        while offset + 8 <= len(self.raw):
+            n = struct.unpack("<I", bytes(self.raw[offset:offset + 4]))[0]
+            data_len = 4 * n * n_cols
+            end = offset + 8 + 8 * n + data_len + _pad(data_len)
+            if n == 0 or end > len(self.raw):
+                break  # truncated tail from an interrupted session
+            self.blocks.append((offset + 8, n))
+            offset = end
+
+        self._times = [self.raw[start:start + 8 * n].view(np.float64) for start, n in self.blocks]
+        self._data = [self.raw[start + 8 * n:start + 8 * n + 4 * n * n_cols].view(np.float32).reshape(n_cols, n)
+                      for start, n in self.blocks]
+        if len(self.blocks) == 1:
+            self.times = self._times[0]
+        else:
+            self.times = np.concatenate(self._times) if self.blocks else np.zeros(0)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def column(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            i = self.index[name]
+            if len(self._data) == 1:
+                column = self._data[0][i]
+            else:
+                column = np.concatenate([block[i] for block in self._data]) if self._data else np.zeros(0, np.float32)
+            self._columns[name] = column
+        return column
+
+    def block_views(self):
+        """ (times, data) views per block, data shaped (columns, rows); nothing is copied """
+        return list(zip(self._times, self._data))
+
+# --- REPLAY ---
+def parse_clock(text):
+    """ '42:10', '1:02:03' or seconds -> seconds """
+    seconds = 0.0
+    for part in str(text).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def format_clock(seconds):
+    m, s = divmod(seconds, 60)
+    h, m = divmod(int(m), 60)
+    return f"{h}:{m:02d}:{s:06.3f}" if h else f"{m}:{s:06.3f}"
+
+def replay(path, config, per_frame=False):
+    """ Runs the StableScore/hold-timer logic over a trace, returns the action timeline.
+    The default batch path evaluates the whole trace as array operations (decide_batch);
+    per_frame=True feeds decide() frame by frame like the live app """
+    from main import EmotionDetector
+
+    reader = TraceReader(path)
+    detector = EmotionDetector(load_models=False, rules=config, windows=config.get('windows'),
+                               hysteresis=config.get('hysteresis'))
+    thresholds = dict(config['thresholds'])
+    enabled_dict = dict(config['enabled'])
+    min_durations = dict(config['min_durations'])
+    t0 = float(reader.times[0]) if len(reader) else 0.0
+
+    if per_frame:
+        timeline = _replay_per_frame(reader, detector, thresholds, enabled_dict, min_durations)
+    else:
+        timeline = _replay_batch(reader, detector, thresholds, enabled_dict, min_durations)
+    for event in timeline:
+        event["time"] = round(event["time"] - t0, 3)
+        event["clock"] = format_clock(event["time"])
+
+    duration = float(reader.times[-1]) - t0 if len(reader) else 0.0
+    return {
+        "frames": len(reader),
+        "duration": duration,
+        "transitions": len(timeline),
+        "flicker_per_min": len(timeline) / (duration / 60) if duration > 0 else 0.0,
+        "timeline": timeline,
+    }
+
+def _replay_batch(reader, detector, thresholds, enabled_dict, min_durations):
+    columns = {name: reader.column(name) for name in reader.columns}
+    actions = detector.decide_batch(columns, reader.times, thresholds, enabled_dict, min_durations)
+    previous = np.concatenate([[detector.actions.index("NEUTRAL")], actions[:-1]])
+    changes = np.flatnonzero(actions != previous)
+    return [{"time": float(reader.times[i]), "action": detector.actions[actions[i]]} for i in changes]
+
+def _replay_per_frame(reader, detector, thresholds, enabled_dict, min_durations):
+    cols = reader.index
+    first_blend = 1
+    n_blend = cols[LANDMARK_COLUMNS[0]] - first_blend
+    timeline = []
+    for times, data in reader.block_views():
+        _replay_block(times, data.T, detector, thresholds, enabled_dict, min_durations, first_blend, n_blend, timeline)
+    return timeline
+
+def _replay_block(times, rows, detector, thresholds, enabled_dict, min_durations, first_blend, n_blend, timeline):
+    from main import FrameFeatures, Point
+
+    for i in range(len(times)):
+        row = rows[i]
+        now = float(times[i])
+        features = None
+        if row[0] > 0:
+            b = first_blend + n_blend
+            tips = []
+            for h in range(HAND_SLOTS):
+                tx, ty, ix, iy = row[b + 4 + h * 4:b + 8 + h * 4]
+                if not np.isnan(tx):
+                    tips.append((Point(float(tx), float(ty)), Point(float(ix), float(iy))))
+            features = FrameFeatures(
+                blendshapes=row[first_blend:b],
+                left_eye_y=float(row[b]), right_eye_y=float(row[b + 1]),
+                chin=Point(float(row[b + 2]), float(row[b + 3])),
+                hand_tips=tips
+            )
+        action = detector.decide(features, thresholds, enabled_dict, min_durations, now)
+        if action != detector.current_action:
+            detector.current_action = action
+            timeline.append({"time": now, "action": action})
+
+def apply_overrides(config, assignments):
+    """ 'thresholds.SMILE=0.6' style overrides """
+    for item in assignments:
+        key, value = item.split("=", 1)
+        section, act = key.split(".", 1)
+        if value.lower() in ("true", "false"): value = value.lower() == "true"
+        elif section == "windows": value = int(value)
+        else: value = float(value)
+        config.setdefault(section, {})[act] = value
+    return config
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay recorded feature traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info")
+    info.add_argument("trace")
+    rep = sub.add_parser("replay")
+    rep.add_argument("trace")
+    rep.add_argument("--config", default="config.json")
+    rep.add_argument("--set", nargs="*", default=[], help="override e.g. thresholds.SMILE=0.6")
+    rep.add_argument("--start", help="only print transitions after this time (mm:ss)")
+    rep.add_argument("--end", help="only print transitions before this time (mm:ss)")
+    rep.add_argument("--per-frame", action="store_true", help="replay frame by frame instead of as arrays")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        reader = TraceReader(args.trace)
+        duration = float(reader.times[-1] - reader.times[0]) if len(reader) else 0.0
+        present = float(reader.column("present").mean()) if len(reader) else 0.0
+        print(f"{len(reader)} frames, {len(reader.blocks)} blocks, {format_clock(duration)}, face in {present:.0%} of frames")
+        return 0
+
+    from main import load_config_file
+    config = apply_overrides(load_config_file(args.config), args.set)
+    report = replay(args.trace, config, per_frame=args.per_frame)
+    start = parse_clock(args.start) if args.start else float("-inf")
+    end = parse_clock(args.end) if args.end else float("inf")
+    report["timeline"] = [e for e in report["timeline"] if start <= e["time"] <= end]
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
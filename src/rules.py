@@ -0,0 +1,287 @@
+""" Declarative emotion rules: expressions over blendshapes and landmarks, compiled once.
+
+Spec (the "features", "rules" and "priority" sections of config.json):
+
+    "features": {"smile": "(mouthSmileLeft + mouthSmileRight) / 2"},
+    "rules": {
+        "SMILE": {"expr": "smile", "suppressed_by": ["WINK"]},
+        "WINK": {"expr": "abs(eyeBlinkLeft - eyeBlinkRight)"},
+        "THINKING": {"expr": "max(0.0, (0.20 - hand_chin_dist) * 5.0)", "requires_hands": true}
+    },
+    "priority": ["THINKING", "WINK", "SMILE"]
+
+Expressions use numbers, input names, earlier features, + - * / **, comparisons,
+and / or / not, `a if cond else b` and max, min, abs, sqrt, clip(x, lo, hi), where(cond, a, b).
+Each spec compiles to two generated functions: one over the Python floats of a single frame
+(live decisions) and one over NumPy columns of a whole trace (replay, tuning). The scalar
+helpers follow NumPy's float rules (NaN propagates through max/min, x / 0 is inf or NaN,
+overflow is inf), so both backends give the same scores and live evaluation never raises.
+A rule's final score is then made safe for smoothing: NaN counts as 0 and infinities are
+clamped to +-SCORE_LIMIT, so one degenerate frame cannot poison a smoothing window.
+"""
+import ast
+import math
+
+import numpy as np
+
+FUNCTIONS = {
+    # name: (arity, scalar template, numpy template)
+    "abs": (1, "abs({0})", "np.abs({0})"),
+    "sqrt": (1, "_sqrt({0})", "np.sqrt({0})"),
+    "where": (3, "({1} if {0} else {2})", "np.where({0}, {1}, {2})"),
+    "clip": (3, "_min(_max({0}, {1}), {2})", "np.minimum(np.maximum({0}, {1}), {2})"),
+}
+FOLDED = {"max": ("_max({0}, {1})", "np.maximum({0}, {1})"), "min": ("_min({0}, {1})", "np.minimum({0}, {1})")}
+BINARY = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Pow: "**"}
+SCORE_LIMIT = 1e6
+COMPARE = {ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=", ast.Eq: "==", ast.NotEq: "!="}
+
+# Scalar helpers with np.maximum / np.minimum / np.sqrt / true_divide / power semantics
+def _max(a, b):
+    if a != a or b != b:
+        return math.nan
+    return a if a >= b else b
+
+def _min(a, b):
+    if a != a or b != b:
+        return math.nan
+    return a if a <= b else b
+
+def _score(x):
+    x = float(x)
+    if x != x:
+        return 0.0
+    return x if -SCORE_LIMIT <= x <= SCORE_LIMIT else math.copysign(SCORE_LIMIT, x)
+
+def _sqrt(x):
+    return math.sqrt(x) if x >= 0 else math.nan
+
+def _div(a, b):
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or not a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    except OverflowError:
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+def _pow(a, b):
+    a, b = float(a), float(b)
+    try:
+        result = a ** b
+    except ZeroDivisionError:
+        # 0 ** negative
+        return -math.inf if math.copysign(1.0, a) < 0 and b.is_integer() and b % 2 else math.inf
+    except OverflowError:
+        return -math.inf if a < 0 and b.is_integer() and b % 2 else math.inf
+    return math.nan if isinstance(result, complex) else result
+
+class _Emitter:
+    """ Turns one expression AST into Python source for the scalar or the NumPy backend """
+    def __init__(self, names, vectorized):
+        self.names = names
+        self.vectorized = vectorized
+
+    def emit(self, node):
+        method = getattr(self, "_" + type(node).__name__, None)
+        if method is None:
+            raise ValueError(f"unsupported syntax: {type(node).__name__}")
+        return method(node)
+
+    def _Expression(self, node):
+        return self.emit(node.body)
+
+    def _Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"unsupported constant {node.value!r}")
+        return repr(float(node.value))
+
+    def _Name(self, node):
+        if node.id not in self.names:
+            raise ValueError(f"unknown name '{node.id}'")
+        return self.names[node.id]
+
+    def _UnaryOp(self, node):
+        operand = self.emit(node.operand)
+        if isinstance(node.op, ast.USub): return f"(-{operand})"
+        if isinstance(node.op, ast.UAdd): return operand
+        if isinstance(node.op, ast.Not):
+            return f"np.logical_not({operand})" if self.vectorized else f"(not {operand})"
+        raise ValueError(f"unsupported operator {type(node.op).__name__}")
+
+    def _BinOp(self, node):
+        op = BINARY.get(type(node.op))
+        if op is None:
+            raise ValueError(f"unsupported operator {type(node.op).__name__}")
+        left, right = self.emit(node.left), self.emit(node.right)
+        if self.vectorized:
+            return f"({left} {op} {right})"
+        # + - * never raise on floats (overflow gives inf); / and ** go through the guarded helpers
+        if op == "/":
+            return f"_div({left}, {right})"
+        if op == "**":
+            return f"_pow({left}, {right})"
+        return f"({left} {op} {right})"
+
+    def _BoolOp(self, node):
+        values = [self.emit(v) for v in node.values]
+        if self.vectorized:
+            fn = "np.logical_and" if isinstance(node.op, ast.And) else "np.logical_or"
+            return self._fold(fn + "({0}, {1})", values)
+        # bool() so the result is True/False like logical_and, not one of the operands
+        return "(" + (" and " if isinstance(node.op, ast.And) else " or ").join(f"bool({v})" for v in values) + ")"
+
+    def _Compare(self, node):
+        operands = [self.emit(node.left)] + [self.emit(c) for c in node.comparators]
+        parts = []
+        for i, op in enumerate(node.ops):
+            symbol = COMPARE.get(type(op))
+            if symbol is None:
+                raise ValueError(f"unsupported comparison {type(op).__name__}")
+            parts.append(f"({operands[i]} {symbol} {operands[i + 1]})")
+        if self.vectorized:
+            return self._fold("np.logical_and({0}, {1})", parts)
+        return "(" + " and ".join(parts) + ")"
+
+    def _IfExp(self, node):
+        test, body, orelse = self.emit(node.test), self.emit(node.body), self.emit(node.orelse)
+        return f"np.where({test}, {body}, {orelse})" if self.vectorized else f"({body} if {test} else {orelse})"
+
+    def _Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError("only plain calls of the built-in functions are allowed")
+        name = node.func.id
+        args = [self.emit(a) for a in node.args]
+        if name in FOLDED:
+            if len(args) < 2:
+                raise ValueError(f"{name}() needs at least 2 arguments")
+            return self._fold(FOLDED[name][self.vectorized], args)
+        if name not in FUNCTIONS:
+            raise ValueError(f"unknown function '{name}'")
+        arity, scalar, vector = FUNCTIONS[name]
+        if len(args) != arity:
+            raise ValueError(f"{name}() takes {arity} argument(s)")
+        return (vector if self.vectorized else scalar).format(*args)
+
+    @staticmethod
+    def _fold(template, args):
+        result = args[0]
+        for arg in args[1:]:
+            result = template.format(result, arg)
+        return result
+
+def _parse(text, where):
+    try:
+        return ast.parse(str(text), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"{where}: {e.msg} in '{text}'") from None
+
+def _check_spec(spec):
+    """ ValueError unless spec has the shape RuleSet reads, so a hand-edited config fails cleanly """
+    def strings(value):
+        return isinstance(value, list) and all(isinstance(v, str) for v in value)
+    features, rules = spec.get("features", {}), spec.get("rules")
+    if not isinstance(features, dict) or not all(isinstance(t, str) for t in features.values()):
+        raise ValueError('"features" must map names to expression strings')
+    if not isinstance(rules, dict):
+        raise ValueError('"rules" must map emotion names to rules')
+    for name, rule in rules.items():
+        if not isinstance(rule, dict) or not isinstance(rule.get("expr"), str):
+            raise ValueError(f'rule {name}: must be an object with an "expr" string')
+        if not strings(rule.get("suppressed_by", [])):
+            raise ValueError(f'rule {name}: "suppressed_by" must be a list of rule names')
+    if not strings(spec.get("priority", [])):
+        raise ValueError('"priority" must be a list of rule names')
+
+class RuleSet:
+    """ Compiled rules. names is in priority order (index i -> action i + 1 in actions);
+    order lists (index, suppressor indices, requires_hands) so suppressors come first;
+    levels groups the same entries into stages that only depend on earlier stages """
+    def __init__(self, spec, inputs):
+        _check_spec(spec)
+        features = dict(spec.get("features", {}))
+        rules = dict(spec["rules"])
+        if not rules:
+            raise ValueError("no rules defined")
+        priority = [r for r in spec.get("priority", []) if r in rules]
+        self.names = priority + [r for r in rules if r not in priority]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.actions = ["NEUTRAL"] + self.names
+        self.inputs = list(inputs)
+        self.input_index = {name: i for i, name in enumerate(self.inputs)}
+        self.requires_hands = [bool(rules[r].get("requires_hands", False)) for r in self.names]
+        self.hand_rules = [r for r, needs in zip(self.names, self.requires_hands) if needs]
+
+        for name in list(features) + self.names:
+            if not name.isidentifier() or name in self.input_index:
+                raise ValueError(f"invalid or reserved name '{name}'")
+        suppressors = []
+        for name in self.names:
+            unknown = [s for s in rules[name].get("suppressed_by", []) if s not in self.index]
+            if unknown:
+                raise ValueError(f"rule {name}: unknown suppressor(s) {', '.join(unknown)}")
+            suppressors.append(tuple(self.index[s] for s in rules[name].get("suppressed_by", [])))
+        self._build_levels(suppressors)
+
+        self.source_scalar = self._generate(features, rules, vectorized=False)
+        self.source_vector = self._generate(features, rules, vectorized=True)
+        namespace = {"np": np, "_score": _score, "_max": _max, "_min": _min, "_sqrt": _sqrt, "_div": _div, "_pow": _pow}
+        exec(compile(self.source_scalar, "<rules>", "exec"), namespace)
+        exec(compile(self.source_vector, "<rules:vector>", "exec"), namespace)
+        self.evaluate = namespace["evaluate"]
+        self._evaluate_columns = namespace["evaluate_columns"]
+
+    def _build_levels(self, suppressors):
+        level = {}
+        def depth(i, seen=()):
+            if i in seen:
+                raise ValueError("suppression cycle: " + " -> ".join(self.names[j] for j in seen + (i,)))
+            if i not in level:
+                level[i] = 1 + max((depth(j, seen + (i,)) for j in suppressors[i]), default=-1)
+            return level[i]
+        for i in range(len(self.names)):
+            depth(i)
+        self.levels = [[(i, suppressors[i], self.requires_hands[i]) for i in range(len(self.names)) if level[i] == d]
+                       for d in range(max(level.values()) + 1)]
+        self.order = [entry for stage in self.levels for entry in stage]
+
+    def _generate(self, features, rules, vectorized):
+        names = {name: f"v[{i}]" for i, name in enumerate(self.inputs)}
+        lines = ["def evaluate_columns(v):" if vectorized else "def evaluate(v):"]
+        for k, (name, text) in enumerate(features.items()):
+            code = _Emitter(names, vectorized).emit(_parse(text, f"feature {name}"))
+            lines.append(f"    f{k} = {code}")
+            names[name] = f"f{k}"
+        results = [_Emitter(names, vectorized).emit(_parse(rules[r]["expr"], f"rule {r}")) for r in self.names]
+        if not vectorized:
+            results = [f"_score({r})" for r in results]
+        lines.append("    return (" + ", ".join(results) + ",)")
+        return "\n".join(lines) + "\n"
+
+    def evaluate_columns(self, columns, n):
+        """ Raw score of every rule over n frames: (len(names), n) float64 array """
+        with np.errstate(all="ignore"):
+            raw = self._evaluate_columns(columns)
+        scores = np.stack([np.broadcast_to(np.asarray(r, dtype=np.float64), (n,)) for r in raw])
+        return np.clip(np.nan_to_num(scores, nan=0.0, posinf=SCORE_LIMIT, neginf=-SCORE_LIMIT), -SCORE_LIMIT, SCORE_LIMIT)
+
+    def self_test(self, samples=8, seed=0):
+        """ Evaluates every rule on sample frames with both backends; raises ValueError when an
+        expression fails or the backends disagree. Cheap enough to run whenever a config loads """
+        rng = np.random.default_rng(seed)
+        rows = np.vstack([np.zeros(len(self.inputs)), np.full(len(self.inputs), 0.5), np.ones(len(self.inputs)),
+                          rng.random((samples, len(self.inputs)))])
+        rows[::2, -1] = np.inf  # inputs like hand_chin_dist are inf when absent
+        try:
+            scalar = np.array([[float(v) for v in self.evaluate(row.tolist())] for row in rows]).T
+            vector = self.evaluate_columns(list(rows.T), len(rows))
+        except Exception as e:
+            raise ValueError(f"rule evaluation failed: {type(e).__name__}: {e}") from None
+        for i, name in enumerate(self.names):
+            if not np.allclose(scalar[i], vector[i], rtol=1e-9, atol=1e-12, equal_nan=True):
+                raise ValueError(f"rule {name}: live and batch evaluation disagree")
+
+def rules_spec(config):
+    """ The part of a config the rule set is compiled from """
+    return {"features": config.get("features", {}), "rules": config["rules"], "priority": config.get("priority", [])}
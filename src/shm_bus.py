@@ -0,0 +1,392 @@
+""" Shared-memory bus: the latest camera frame and detection result for other local programs.
+
+The controller owns the camera; overlays, OBS scripts and other tools read from here instead
+of opening the device again or running their own face tracking. Two named segments:
+
+    <name>_frames   header + two frame slots (double buffer, BGR uint8)
+    <name>_state    header + one result record (landmarks, smoothed scores, current action)
+
+Every slot and the record start with a uint64 sequence number that is odd while the publisher
+writes. Readers never lock: copy, re-read the sequence, drop the copy if it moved. Frames
+alternate between the two slots, so a reader copying the newest one is not overwritten by the
+next frame. The layouts are the numpy dtypes below (little-endian, no padding), so other
+languages can map them too. A segment is created zeroed and its magic is written last: readers
+skip it until the magic (b"VEADOFRM" / b"VEADOSTA"), VERSION and a non-zero frame size are there.
+
+    python shm_bus.py read            # print the results as they arrive
+    python shm_bus.py read --frames   # also copy the frames, report their rate
+
+    from shm_bus import BusReader
+    bus = BusReader()
+    frame = bus.frame()   # newest frame (numpy array) or None
+    state = bus.state()   # dict or None
+"""
+import os
+import sys
+import time
+import argparse
+from multiprocessing import shared_memory
+
+import numpy as np
+
+VERSION = 1
+SLOTS = 2
+MAX_RULES = 32
+BLENDSHAPES = 52
+HAND_SLOTS = 2  # as in the trace format
+
+FRAME_HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("live", "<u4"),  # live is 0 once the publisher closed
+    ("height", "<u4"), ("width", "<u4"), ("channels", "<u4"),
+    ("latest", "<u4"),  # slot holding the newest complete frame
+    ("published", "<u8"),
+])
+SLOT_HEADER = np.dtype([("seq", "<u8"), ("frame_index", "<u8"), ("timestamp", "<f8")])
+
+STATE_HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("live", "<u4"),
+    ("n_rules", "<u4"), ("rules", "S32", (MAX_RULES,)),  # action i > 0 is rules[i - 1], 0 is NEUTRAL
+])
+STATE_RECORD = np.dtype([
+    ("seq", "<u8"), ("frame_index", "<u8"), ("timestamp", "<f8"),
+    ("face", "<u4"), ("inferred", "<u4"),  # inferred is 0 when the motion gate reused the last features
+    ("action", "<i4"), ("hands", "<u4"),
+    ("left_eye_y", "<f4"), ("right_eye_y", "<f4"), ("chin", "<f4", (2,)),
+    ("hand_tips", "<f4", (HAND_SLOTS, 2, 2)),  # hand, thumb/index, x/y; NaN when absent
+    ("blendshapes", "<f4", (BLENDSHAPES,)),
+    ("scores", "<f4", (MAX_RULES,)),
+    ("action_name", "S32"),
+])
+
+def _create(name, size):
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # Left behind by a publisher that did not close (POSIX keeps segments until unlinked)
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+def _attach(name):
+    """ Opens an existing segment without handing it to this process' resource tracker,
+    which would unlink it when the reader exits """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class _FrameRing:
+    """ Views over a frames segment. ValueError when the header is not (yet) a valid one:
+    the publisher fills it in after creating the zeroed segment """
+    def __init__(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((), dtype=FRAME_HEADER, buffer=shm.buf)
+        h, w, c = (int(self.header[k]) for k in ("height", "width", "channels"))
+        if (bytes(self.header["magic"]) != b"VEADOFRM" or int(self.header["version"]) != VERSION
+                or not (h and w and c) or shm.size < self.size((h, w, c))):
+            del self.header
+            raise ValueError("not a complete frames segment")
+        self.shape = (h, w, c) if c > 1 else (h, w)
+        self.slot_size = SLOT_HEADER.itemsize + h * w * c
+        self.slots = [np.ndarray((), dtype=SLOT_HEADER, buffer=shm.buf, offset=self.offset(i)) for i in range(SLOTS)]
+        self.pixels = [np.ndarray(self.shape, dtype=np.uint8, buffer=shm.buf, offset=self.offset(i) + SLOT_HEADER.itemsize)
+                       for i in range(SLOTS)]
+
+    @staticmethod
+    def size(shape):
+        return FRAME_HEADER.itemsize + SLOTS * (SLOT_HEADER.itemsize + int(np.prod(shape)))
+
+    def offset(self, i):
+        return FRAME_HEADER.itemsize + i * self.slot_size
+
+    def close(self):
+        # Views must go before the mapping can be closed
+        del self.header, self.slots, self.pixels
+        self.shm.close()
+
+class _StateRecord:
+    def __init__(self, shm, check=True):
+        self.shm = shm
+        if shm.size < STATE_HEADER.itemsize + STATE_RECORD.itemsize:
+            raise ValueError("state segment too small")
+        self.header = np.ndarray((), dtype=STATE_HEADER, buffer=shm.buf)
+        if check and (bytes(self.header["magic"]) != b"VEADOSTA" or int(self.header["version"]) != VERSION
+                      or int(self.header["n_rules"]) > MAX_RULES):
+            del self.header
+            raise ValueError("not a complete state segment")
+        self.record = np.ndarray((), dtype=STATE_RECORD, buffer=shm.buf, offset=STATE_HEADER.itemsize)
+
+    def close(self):
+        del self.header, self.record
+        self.shm.close()
+
+# --- PUBLISHER ---
+class BusPublisher:
+    """ Writer side, called from one thread (the inference worker or the Tk loop).
+    The frames segment is sized from `shape` (h, w, channels), or from the first frame, and
+    recreated if the camera mode changes. On Windows a segment lives on while a reader has it
+    open, so creating it again can raise FileExistsError: passing the shape makes that happen
+    here rather than in publish() """
+    def __init__(self, name="veado", rules=(), shape=None):
+        self.name = name
+        self.rules = list(rules)[:MAX_RULES]
+        self.actions = ["NEUTRAL"] + self.rules
+        self.frame_index = 0
+        self.ring = None
+        self.state = _StateRecord(_create(f"{name}_state", STATE_HEADER.itemsize + STATE_RECORD.itemsize), check=False)
+        header = self.state.header
+        header["version"], header["n_rules"] = VERSION, len(self.rules)
+        header["rules"][:len(self.rules)] = [r.encode()[:32] for r in self.rules]
+        header["live"] = 1
+        header["magic"] = b"VEADOSTA"  # last: readers accept the segment once the magic is there
+        if shape:
+            try:
+                self._open_ring(tuple(shape))
+            except BaseException:
+                self.close()
+                raise
+
+    def publish(self, frame, action, features=None, scores=None, inferred=True):
+        """ frame: BGR image. features/scores: the detector's FrameFeatures and smoothed score
+        values (rule order) of this frame, or None for frames that were only captured """
+        self.frame_index += 1
+        now = time.time()
+        self._publish_frame(frame, now)
+        if scores is not None:
+            self._publish_state(action, features, scores, inferred, now)
+
+    def _publish_frame(self, frame, now):
+        shape = frame.shape if frame.ndim == 3 else frame.shape + (1,)
+        ring = self.ring
+        if ring is None or ring.shape[:2] != shape[:2] or ring.shape[2:] != frame.shape[2:]:
+            ring = self._open_ring(shape)
+        slot = 1 - int(ring.header["latest"])
+        header = ring.slots[slot]
+        header["seq"] += 1
+        np.copyto(ring.pixels[slot], frame)
+        header["frame_index"], header["timestamp"] = self.frame_index, now
+        header["seq"] += 1
+        ring.header["latest"] = slot
+        ring.header["published"] += 1
+
+    def _open_ring(self, shape):
+        if self.ring:
+            self._close_ring()
+        h, w, c = shape
+        shm = _create(f"{self.name}_frames", _FrameRing.size((h, w, c)))
+        header = np.ndarray((), dtype=FRAME_HEADER, buffer=shm.buf)
+        header["version"] = VERSION
+        header["height"], header["width"], header["channels"] = h, w, c
+        header["latest"] = SLOTS - 1  # the first frame goes to slot 0
+        header["live"] = 1
+        header["magic"] = b"VEADOFRM"  # last: readers accept the segment once the magic is there
+        del header
+        self.ring = _FrameRing(shm)
+        return self.ring
+
+    def _publish_state(self, action, features, scores, inferred, now):
+        rec = self.state.record
+        rec["seq"] += 1
+        rec["frame_index"], rec["timestamp"] = self.frame_index, now
+        rec["inferred"] = bool(inferred)
+        rec["action"] = self.actions.index(action) if action in self.actions else -1
+        rec["action_name"] = action.encode()[:32]
+        n = len(self.rules)
+        rec["scores"][:n] = scores[:n]
+        if features is None:
+            rec["face"] = rec["hands"] = 0
+        else:
+            rec["face"], rec["hands"] = 1, min(len(features.hand_tips), HAND_SLOTS)
+            rec["left_eye_y"], rec["right_eye_y"] = features.left_eye_y, features.right_eye_y
+            rec["chin"] = (features.chin.x, features.chin.y)
+            rec["blendshapes"] = features.blendshapes
+            tips = rec["hand_tips"]
+            tips[...] = np.nan
+            for h, (thumb, index) in enumerate(features.hand_tips[:HAND_SLOTS]):
+                tips[h] = ((thumb.x, thumb.y), (index.x, index.y))
+        rec["seq"] += 1
+
+    def _close_ring(self):
+        # Readers see live == 0 and reattach to the new segment
+        self.ring.header["live"] = 0
+        shm = self.ring.shm
+        self.ring.close()
+        shm.unlink()
+        self.ring = None
+
+    def close(self):
+        if self.ring:
+            self._close_ring()
+        if self.state:
+            self.state.header["live"] = 0
+            shm = self.state.shm
+            self.state.close()
+            shm.unlink()
+            self.state = None
+
+# --- READER CLIENT ---
+class BusReader:
+    """ Lock-free reader. Every call returns only data newer than the previous call,
+    and reconnects by itself when the publisher restarts or changes the frame size """
+    def __init__(self, name="veado"):
+        self.name = name
+        self.ring = None
+        self.state_seg = None
+        self.last_frame = None
+        self.last_state = 0
+        self.info = None
+        self.rules = []
+
+    def _frames(self):
+        if self.ring is not None and not self.ring.header["live"]:
+            self.ring.close()
+            self.ring, self.last_frame = None, None
+        if self.ring is None:
+            self.ring = self._open(_FrameRing, f"{self.name}_frames")
+        return self.ring
+
+    @staticmethod
+    def _open(kind, name):
+        """ Attached segment, or None when it is missing or its header is not complete yet
+        (the next call tries again) """
+        try:
+            shm = _attach(name)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            segment = kind(shm)
+        except ValueError:
+            shm.close()
+            return None
+        if not segment.header["live"]:
+            segment.close()
+            return None
+        return segment
+
+    def _state(self):
+        if self.state_seg is not None and not self.state_seg.header["live"]:
+            self.state_seg.close()
+            self.state_seg, self.last_state = None, 0
+        if self.state_seg is None:
+            self.state_seg = self._open(_StateRecord, f"{self.name}_state")
+            if self.state_seg is None:
+                return None
+            header = self.state_seg.header
+            self.rules = [r.decode() for r in header["rules"][:int(header["n_rules"])]]
+        return self.state_seg
+
+    def frame(self, out=None):
+        """ Copy of the newest frame (into out when its shape matches), or None
+        when nothing new was published; frame_info() tells its index and time """
+        ring = self._frames()
+        if ring is None:
+            return None
+        slot = int(ring.header["latest"])
+        header = ring.slots[slot]
+        seq = int(header["seq"])
+        if seq == 0 or seq & 1 or (slot, seq) == self.last_frame:
+            return None
+        if out is None or out.shape != ring.shape:
+            out = np.empty(ring.shape, dtype=np.uint8)
+        np.copyto(out, ring.pixels[slot])
+        info = (int(header["frame_index"]), float(header["timestamp"]))
+        if int(header["seq"]) != seq:
+            return None  # overwritten while copying: this reader is more than a frame behind
+        self.last_frame = (slot, seq)
+        self.info = info
+        return out
+
+    def frame_info(self):
+        """ (frame_index, timestamp) of the last frame returned """
+        return self.info
+
+    def state(self):
+        """ Newest result as a dict, or None when nothing new was published """
+        seg = self._state()
+        if seg is None:
+            return None
+        for _ in range(3):
+            seq = int(seg.record["seq"])
+            if seq == 0 or seq == self.last_state:
+                return None
+            if seq & 1:
+                continue
+            rec = seg.record.copy()[()]
+            if int(seg.record["seq"]) == seq:
+                self.last_state = seq
+                return self._as_dict(rec)
+        return None
+
+    def _as_dict(self, rec):
+        n = len(self.rules)
+        hands = int(rec["hands"])
+        return {
+            "frame_index": int(rec["frame_index"]),
+            "timestamp": float(rec["timestamp"]),
+            "action": rec["action_name"].decode(),
+            "inferred": bool(rec["inferred"]),
+            "scores": dict(zip(self.rules, rec["scores"][:n].tolist())),
+            "face": bool(rec["face"]),
+            "left_eye_y": float(rec["left_eye_y"]) if rec["face"] else None,
+            "right_eye_y": float(rec["right_eye_y"]) if rec["face"] else None,
+            "chin": tuple(rec["chin"].tolist()) if rec["face"] else None,
+            "hand_tips": rec["hand_tips"][:hands].tolist() if rec["face"] else [],
+            "blendshapes": rec["blendshapes"] if rec["face"] else None,
+        }
+
+    def wait(self, timeout=1.0, poll=0.002):
+        """ Blocks until a new state arrives (or timeout), returns it or None """
+        deadline = time.perf_counter() + timeout
+        while True:
+            state = self.state()
+            if state is not None or time.perf_counter() > deadline:
+                return state
+            time.sleep(poll)
+
+    def close(self):
+        if self.ring: self.ring.close()
+        if self.state_seg: self.state_seg.close()
+        self.ring = self.state_seg = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read the controller's shared-memory bus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("read", help="print the results as they arrive")
+    p.add_argument("--name", default="veado")
+    p.add_argument("--frames", action="store_true", help="also copy every frame and report the frame rate")
+    p.add_argument("--duration", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    reader = BusReader(args.name)
+    start = report = time.perf_counter()
+    frames = 0
+    buffer = None
+    try:
+        while args.duration is None or time.perf_counter() - start < args.duration:
+            if args.frames:
+                frame = reader.frame(buffer)
+                if frame is not None:
+                    buffer, frames = frame, frames + 1
+            state = reader.state()
+            if state:
+                top = max(state["scores"].items(), key=lambda s: s[1], default=("-", 0.0))
+                print(f"#{state['frame_index']} {state['action']:<10} face={state['face']} "
+                      f"top {top[0]} {top[1]:.2f}" + ("" if state["inferred"] else " (reused)"))
+            now = time.perf_counter()
+            if args.frames and now - report >= 1.0:
+                print(f"-- {frames / (now - report):.1f} frames/s")
+                frames, report = 0, now
+            time.sleep(0.002)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
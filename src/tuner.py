@@ -0,0 +1,184 @@
+""" Offline auto-tuner: searches thresholds, hold durations, hysteresis gaps and smoothing windows
+over labelled session traces, one worker process per core.
+
+Each trace (see recording.py) needs a label file next to it, `<trace name>.labels.json`:
+
+    [{"start": "0:12", "end": "0:15.5", "action": "SMILE"}, {"start": "1:02", "end": "1:04", "action": "WINK"}]
+
+Times are relative to the start of the trace; unlabelled frames are NEUTRAL.
+
+    python tuner.py traces/*.vtrace --search random --samples 2000 --output config.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import RULE_INPUTS, CONFIG_FILE, EmotionDetector, load_config_file, save_config_file
+from recording import TraceReader, parse_clock
+from rules import RuleSet, rules_spec
+
+# Search range of every parameter group
+SPACE = {
+    "thresholds": (0.05, 0.95),
+    "min_durations": (0.0, 2.0),
+    "hysteresis": (0.02, 0.30),
+    "windows": (2, 10),
+}
+GRID_STEPS = {"thresholds": 10, "min_durations": 9, "hysteresis": 8, "windows": 9}
+
+# --- SESSIONS ---
+def labels_path(trace_path):
+    return os.path.splitext(trace_path)[0] + ".labels.json"
+
+def load_labels(path, times, actions):
+    """ Per-frame label as an index into actions (NEUTRAL first, then the rules) """
+    labels = np.zeros(len(times), dtype=np.int64)
+    t0 = times[0] if len(times) else 0.0
+    with open(path) as f:
+        for segment in json.load(f):
+            start = t0 + parse_clock(segment["start"])
+            end = t0 + parse_clock(segment["end"])
+            labels[(times >= start) & (times < end)] = actions.index(segment["action"])
+    return labels
+
+_sessions = []
+_rules = None
+
+def _init_worker(trace_paths, spec):
+    """ Each worker compiles the rules and maps the traces once, then keeps them for every candidate """
+    global _rules
+    _rules = RuleSet(spec, RULE_INPUTS)
+    for path in trace_paths:
+        reader = TraceReader(path)
+        columns = {name: reader.column(name) for name in reader.columns}
+        _sessions.append((columns, reader.times, load_labels(labels_path(path), reader.times, _rules.actions)))
+
+# --- EVALUATION ---
+def evaluate(params, flicker_weight):
+    """ Returns (loss, mismatch rate, transitions per minute) of a parameter set on all sessions """
+    frames = mismatched = transitions = 0
+    minutes = 0.0
+    for columns, times, labels in _sessions:
+        detector = EmotionDetector(load_models=False, rules=_rules, windows=params['windows'],
+                                   hysteresis=params['hysteresis'])
+        actions = detector.decide_batch(columns, times, params['thresholds'], params['enabled'], params['min_durations'])
+        frames += len(actions)
+        mismatched += int(np.count_nonzero(actions != labels))
+        transitions += int(np.count_nonzero(actions[1:] != actions[:-1]))
+        minutes += (times[-1] - times[0]) / 60 if len(times) > 1 else 0.0
+    mismatch = mismatched / frames if frames else 0.0
+    flicker = transitions / minutes if minutes else 0.0
+    return mismatch + flicker_weight * flicker, mismatch, flicker
+
+def _evaluate_job(job):
+    params, flicker_weight = job
+    return evaluate(params, flicker_weight)
+
+def base_params(config):
+    return {key: dict(config[key]) for key in ("thresholds", "min_durations", "hysteresis", "windows", "enabled")}
+
+def sample(rng, base, groups, emotions):
+    params = {key: dict(value) for key, value in base.items()}
+    for group in groups:
+        lo, hi = SPACE[group]
+        for act in emotions:
+            if group == "windows":
+                params[group][act] = int(rng.integers(lo, hi + 1))
+            else:
+                params[group][act] = round(float(rng.uniform(lo, hi)), 3)
+    return params
+
+def grid_values(group):
+    lo, hi = SPACE[group]
+    if group == "windows":
+        return list(range(lo, hi + 1))
+    return [round(v, 3) for v in np.linspace(lo, hi, GRID_STEPS[group])]
+
+# --- SEARCH ---
+def random_search(pool, base, groups, emotions, samples, flicker_weight, seed):
+    rng = np.random.default_rng(seed)
+    candidates = [base] + [sample(rng, base, groups, emotions) for _ in range(samples)]
+    results = pool.map(_evaluate_job, [(c, flicker_weight) for c in candidates], chunksize=max(1, samples // 256))
+    best = min(zip(results, candidates), key=lambda r: r[0][0])
+    return best[1], best[0]
+
+def grid_search(pool, base, groups, emotions, passes, flicker_weight):
+    """ Coordinate-wise grid: every value of one parameter in parallel, keep the best, move on """
+    best, best_score = base, pool.submit(_evaluate_job, (base, flicker_weight)).result()
+    for _ in range(passes):
+        improved = False
+        for group in groups:
+            for act in emotions:
+                candidates = []
+                for value in grid_values(group):
+                    params = {key: dict(v) for key, v in best.items()}
+                    params[group][act] = value
+                    candidates.append(params)
+                results = list(pool.map(_evaluate_job, [(c, flicker_weight) for c in candidates]))
+                i = min(range(len(results)), key=lambda k: results[k][0])
+                if results[i][0] < best_score[0]:
+                    best, best_score, improved = candidates[i], results[i], True
+        if not improved:
+            break
+    return best, best_score
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune detection settings on labelled session traces.")
+    parser.add_argument("traces", nargs="+", help="trace files, each with a .labels.json next to it")
+    parser.add_argument("--search", choices=("random", "grid"), default="random")
+    parser.add_argument("--samples", type=int, default=1000, help="random search: candidates to try")
+    parser.add_argument("--passes", type=int, default=2, help="grid search: passes over all parameters")
+    parser.add_argument("--params", nargs="+", choices=list(SPACE), default=list(SPACE))
+    parser.add_argument("--emotions", nargs="+", help="rules to tune (default: all rules of the config)")
+    parser.add_argument("--flicker-weight", type=float, default=0.01,
+                        help="loss = mismatch rate + weight * transitions per minute")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default=CONFIG_FILE, help="starting point")
+    parser.add_argument("--output", default=CONFIG_FILE, help="where to write the tuned config")
+    parser.add_argument("--dry-run", action="store_true", help="print the result without writing it")
+    args = parser.parse_args(argv)
+
+    for path in args.traces:
+        if not os.path.exists(labels_path(path)):
+            parser.error(f"missing labels for {path}: {labels_path(path)}")
+
+    config = load_config_file(args.config)
+    try:
+        names = RuleSet(rules_spec(config), RULE_INPUTS).names
+    except ValueError as e:
+        parser.error(f"invalid rules in {args.config}: {e}")
+    unknown = [act for act in args.emotions or [] if act not in names]
+    if unknown:
+        parser.error(f"unknown emotion(s) {', '.join(unknown)}; the config defines {', '.join(names)}")
+    emotions = args.emotions or names
+    base = base_params(config)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.traces, rules_spec(config))) as pool:
+        before = pool.submit(_evaluate_job, (base, args.flicker_weight)).result()
+        if args.search == "random":
+            best, score = random_search(pool, base, args.params, emotions, args.samples, args.flicker_weight, args.seed)
+        else:
+            best, score = grid_search(pool, base, args.params, emotions, args.passes, args.flicker_weight)
+
+    print(f"Searched in {time.perf_counter() - start:.1f} s on {args.workers} workers")
+    print(f"before: loss {before[0]:.4f}, mismatch {before[1]:.1%}, {before[2]:.1f} transitions/min")
+    print(f"after : loss {score[0]:.4f}, mismatch {score[1]:.1%}, {score[2]:.1f} transitions/min")
+
+    for group in args.params:
+        config[group].update(best[group])
+    if args.dry_run:
+        print(json.dumps({group: config[group] for group in args.params}, indent=4))
+    else:
+        save_config_file(config, args.output)
+        print(f"Saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
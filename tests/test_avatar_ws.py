@@ -0,0 +1,84 @@
+import json
+import time
+
+import pytest
+
+import avatar_ws
+from avatar_ws import MockAvatarServer, WebSocketBackend
+
+class RecordingFallback:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, action, key):
+        self.sent.append((action, key))
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatar_ws, "VTS_TOKEN_FILE", str(tmp_path / "token.txt"))
+    server = MockAvatarServer()
+    yield server
+    server.close()
+
+def _types(server):
+    return [json.loads(m)["messageType"] for m in server.messages]
+
+def _received(server, message_type, count=1, timeout=2.0):
+    deadline = time.time() + timeout
+    while _types(server).count(message_type) < count and time.time() < deadline:
+        time.sleep(0.01)
+    return _types(server).count(message_type) >= count
+
+def test_round_trip_drop_and_reconnect(server):
+    settings = {"protocol": "vtubestudio", "url": server.url, "stream_scores": True,
+                "states": {"SMILE": "hotkey-smile", "NEUTRAL": "hotkey-neutral"}, "parameters": {"SMILE": "VeadoSmile"}}
+    fallback = RecordingFallback()
+    backend = WebSocketBackend(settings, fallback=fallback)
+    try:
+        assert backend.wait_connected(2.0)
+        backend.send("SMILE", "f14")
+        backend.send_scores({"SMILE": 0.8})
+        backend.send("WINK", "f19")  # no avatar state mapped
+        assert fallback.sent == [("WINK", "f19")]
+        assert _received(server, "InjectParameterDataRequest")
+
+        server.disconnect_clients()
+        time.sleep(0.1)
+        backend.send("NEUTRAL", "f13")
+        assert fallback.sent[-1] == ("NEUTRAL", "f13") and not backend.connected
+        assert backend.wait_connected(backend.backoff + 2.0)
+        backend.send("SMILE", "f14")
+        assert _received(server, "HotkeyTriggerRequest", 2)
+    finally:
+        backend.close()
+
+    types = _types(server)
+    assert types.count("AuthenticationRequest") == 2  # token requested once, reused on reconnect
+    assert types.count("HotkeyTriggerRequest") == 2
+    inject = [json.loads(m) for m in server.messages if "InjectParameterDataRequest" in m]
+    assert inject[0]["data"]["parameterValues"] == [{"id": "VeadoSmile", "value": 0.8}]
+
+def test_slow_authentication_does_not_block_send(server, monkeypatch):
+    def slow_connect(self, ws):
+        time.sleep(1.0)  # the user has not answered VTube Studio's popup yet
+    monkeypatch.setattr(avatar_ws.VTubeStudioProtocol, "on_connect", slow_connect)
+    fallback = RecordingFallback()
+    backend = WebSocketBackend({"url": server.url, "states": {"SMILE": "hotkey-smile"}}, fallback=fallback)
+    try:
+        start = time.perf_counter()
+        backend.send("SMILE", "f14")
+        assert time.perf_counter() - start < 0.2
+        assert fallback.sent == [("SMILE", "f14")]
+        assert backend.wait_connected(3.0)
+    finally:
+        backend.close()
+
+def test_unreachable_app_falls_back():
+    fallback = RecordingFallback()
+    backend = WebSocketBackend({"protocol": "veadotube", "url": "ws://127.0.0.1:9", "states": {"SMILE": "happy"}},
+                               fallback=fallback)
+    try:
+        backend.send("SMILE", "f14")
+        assert fallback.sent == [("SMILE", "f14")]
+    finally:
+        backend.close()
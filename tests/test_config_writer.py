@@ -0,0 +1,31 @@
+import json
+import time
+
+from main import ConfigWriter
+
+def test_saves_are_coalesced(tmp_path):
+    path = tmp_path / "config.json"
+    writer = ConfigWriter(str(path), delay=0.2)
+    try:
+        for n in range(5):
+            writer.save({"n": n})
+        time.sleep(0.05)
+        assert not path.exists()
+        assert writer.flush()
+        assert json.loads(path.read_text()) == {"n": 4}
+        assert writer.writes == 1
+    finally:
+        writer.close()
+
+def test_failed_write_is_reported(tmp_path):
+    writer = ConfigWriter(str(tmp_path / "missing" / "config.json"), delay=0.0)
+    try:
+        writer.save({"n": 1})
+        assert not writer.flush()
+        assert isinstance(writer.error, OSError)
+
+        writer.path = str(tmp_path / "config.json")
+        writer.save({"n": 2})
+        assert writer.flush() and writer.error is None
+    finally:
+        writer.close()
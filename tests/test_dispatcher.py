@@ -0,0 +1,63 @@
+import threading
+import time
+
+from main import KeyDispatcher, OutputBackend
+
+class BlockingBackend(OutputBackend):
+    """ The first send waits until released, like a slow key press """
+    def __init__(self):
+        self.sent = []
+        self.scores = []
+        self.busy = threading.Event()
+        self.release = threading.Event()
+        self.closed = False
+
+    def send(self, action, key):
+        self.sent.append((action, key))
+        self.busy.set()
+        self.release.wait(2.0)
+
+    def send_scores(self, scores):
+        self.scores.append(scores)
+
+    def close(self):
+        self.closed = True
+
+def _wait(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)  # anything else that was going to arrive has arrived
+    return condition()
+
+def test_only_the_latest_action_is_sent():
+    backend = BlockingBackend()
+    dispatcher = KeyDispatcher(backend, keys={"SMILE": "f14", "WINK": "f19", "NEUTRAL": "f13"}, stream_scores=True)
+    try:
+        dispatcher.submit("SMILE")
+        assert backend.busy.wait(2.0)
+        # While the first key is being sent, newer decisions replace each other
+        dispatcher.submit("WINK")
+        dispatcher.submit("NEUTRAL")
+        dispatcher.submit_scores({"SMILE": 0.1})
+        dispatcher.submit_scores({"SMILE": 0.2})
+        backend.release.set()
+        assert _wait(lambda: len(backend.sent) == 2 and backend.scores)
+        assert backend.sent == [("SMILE", "f14"), ("NEUTRAL", "f13")]
+        assert backend.scores == [{"SMILE": 0.2}]
+        assert dispatcher.coalesced == 1 and dispatcher.sent == 2
+    finally:
+        dispatcher.close()
+    assert backend.closed
+
+def test_scores_ignored_unless_streamed():
+    backend = BlockingBackend()
+    backend.release.set()
+    dispatcher = KeyDispatcher(backend, keys={"SMILE": "f14"})
+    try:
+        dispatcher.submit_scores({"SMILE": 0.5})
+        dispatcher.submit("SMILE", "f1")  # explicit key, e.g. the setup wizard
+        assert _wait(lambda: backend.sent)
+        assert backend.sent == [("SMILE", "f1")] and backend.scores == []
+    finally:
+        dispatcher.close()
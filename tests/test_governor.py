@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from main import Governor, default_config
+from metrics import METRICS
+
+def _governor(check_interval=2.0, **overrides):
+    settings = dict(default_config()["governor"], **overrides)
+    governor = Governor(settings, check_interval=check_interval)
+    # CPU load held at 0: only the latency budget moves the level
+    governor._sample_cpu = lambda: (0.0, 0.0, None)
+    governor.cpu_sample = governor._sample_cpu()
+    return governor
+
+def test_rate_is_cut_before_resolution():
+    governor = _governor(inference_width=640, min_inference_width=320, capture_fps=30, min_inference_fps=10)
+    assert governor.levels == [(640, 30.0), (640, 22.5), (480, 22.5), (480, 15.0), (320, 15.0), (320, 10.0)]
+
+@pytest.mark.parametrize("min_fps", [30, 60])
+def test_no_level_repeats_or_exceeds_the_camera(min_fps):
+    governor = _governor(capture_fps=30, min_inference_fps=min_fps)
+    assert governor.levels == [(640, 30.0), (480, 30.0), (320, 30.0)]
+
+def test_levels_follow_a_slower_camera():
+    governor = _governor(capture_fps=30, min_inference_fps=20)
+    assert max(rate for _, rate in governor._build_levels(15.0)) == 15.0
+    assert len(set(governor._build_levels(15.0))) == len(governor._build_levels(15.0))
+
+def _check(governor, samples_ms):
+    for ms in samples_ms:
+        METRICS.record("inferred", ms)
+    time.sleep(max(0.0, governor.next_check - time.perf_counter()) + 0.005)
+    return governor.update()
+
+def test_steps_down_once_and_recovers():
+    METRICS.reset()
+    governor = _governor(check_interval=0.03, latency_budget_ms=60)
+    try:
+        assert _check(governor, [100.0] * 20) and governor.level == 1
+        # Faster frames after the step: the slow ones before it no longer count
+        assert not _check(governor, [10.0] * 20) and governor.level == 1
+        assert not _check(governor, [10.0] * 20)
+        assert _check(governor, [10.0] * 20) and governor.level == 0  # third calm check
+        assert not _check(governor, [])  # nothing inferred: calm, already at the top
+    finally:
+        METRICS.reset()
+
+def test_rate_cap_admits_evenly():
+    governor = _governor(capture_fps=30, min_inference_fps=10)
+    governor.level = len(governor.levels) - 1  # 10 fps
+    admitted = [governor.admit(now=n / 30) for n in range(1, 31)]
+    assert sum(admitted) == 10
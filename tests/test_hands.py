@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+from main import HandScheduler, Point, hands_in_frame
+
+Landmark = namedtuple("Landmark", "x y")
+HandResult = namedtuple("HandResult", "hand_landmarks")
+
+def test_crop_landmarks_map_to_full_frame():
+    # 640x480 frame, crop from (160, 120) to (480, 360): half the width and height
+    result = HandResult([[Landmark(0.0, 0.0), Landmark(0.5, 0.5), Landmark(1.0, 1.0)]])
+    hands = hands_in_frame(result, (160, 120, 480, 360), 640, 480)
+    assert hands == [[Point(0.25, 0.25), Point(0.5, 0.5), Point(0.75, 0.75)]]
+    assert hands_in_frame(HandResult([]), (0, 0, 640, 480), 640, 480) == []
+    assert hands_in_frame(None, (0, 0, 640, 480), 640, 480) == []
+
+def test_crop_is_clipped_to_the_frame():
+    scheduler = HandScheduler(idle_interval=1, crop_radius=0.25)
+    scheduler.observe((0.1, 0.9), float("inf"))
+    assert scheduler.plan(True, 640, 480) == (0, 312, 224, 480)
+
+def test_cadence():
+    scheduler = HandScheduler(idle_interval=3)
+    assert scheduler.plan(True, 640, 480) is None  # no chin yet
+    scheduler.observe((0.5, 0.5), float("inf"))
+    # No hand near the chin: every third frame
+    ran = [scheduler.plan(True, 640, 480) is not None for _ in range(6)]
+    assert ran == [False, False, True, False, False, True]
+    # A hand near the chin: every frame
+    scheduler.observe((0.5, 0.5), 0.1)
+    assert all(scheduler.plan(True, 640, 480) is not None for _ in range(4))
+    assert scheduler.plan(False, 640, 480) is None
+
+def test_box_kept_while_tracking():
+    scheduler = HandScheduler(idle_interval=1, keep_box=True)
+    scheduler.observe((0.5, 0.5), float("inf"))
+    first = scheduler.plan(True, 640, 480)
+    scheduler.observe((0.5, 0.5), 0.1)  # hand found in this crop
+    scheduler.observe((0.6, 0.5), 0.1)  # chin moved, hand still tracked
+    assert scheduler.plan(True, 640, 480) == first
+    scheduler.observe((0.6, 0.5), float("inf"))  # hand lost: follow the chin again
+    assert scheduler.plan(True, 640, 480) != first
+
+    image_mode = HandScheduler(idle_interval=1)
+    image_mode.observe((0.5, 0.5), 0.1)
+    first = image_mode.plan(True, 640, 480)
+    image_mode.observe((0.6, 0.5), 0.1)
+    assert image_mode.plan(True, 640, 480) != first
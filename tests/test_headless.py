@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+def test_headless_tools_import_without_tk():
+    # None in sys.modules makes "import tkinter" raise ImportError, like a machine without Tk
+    code = ("import sys; sys.modules['tkinter'] = sys.modules['_tkinter'] = None\n"
+            "import headless, bench, tuner, recording\n")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import main
+from main import MotionGate
+
+@pytest.fixture(autouse=True, scope="module")
+def heavy_modules():
+    main.load_heavy_modules()  # the gate resizes with cv2
+
+def _frame(value=100, size=(240, 320)):
+    return np.full(size + (3,), value, dtype=np.uint8)
+
+def test_first_frame_is_inferred_then_still_frames_reuse():
+    gate = MotionGate(threshold=3.0, max_skip=10)
+    assert not gate.still(_frame())
+    assert gate.still(_frame())
+    assert gate.still(_frame(101))  # camera noise under the threshold
+    assert (gate.checked, gate.skipped) == (3, 2)
+
+def test_local_change_is_seen():
+    gate = MotionGate(threshold=3.0)
+    gate.still(_frame())
+    frame = _frame()
+    frame[100:130, 150:190] = 200  # a wink-sized change, small against the whole frame
+    assert not gate.still(frame)
+    assert gate.still(frame)  # the changed frame is the new reference
+
+def test_forced_refresh_after_max_skip():
+    gate = MotionGate(max_skip=3)
+    results = [gate.still(_frame()) for _ in range(9)]
+    assert results == [False, True, True, True, False, True, True, True, False]
+
+def test_face_roi_ignores_changes_elsewhere():
+    gate = MotionGate(threshold=3.0, face_roi=True)
+    gate.observe((0.4, 0.4, 0.6, 0.6))  # widened by half the face on each side
+    gate.still(_frame())
+    frame = _frame()
+    frame[:, :40] = 255  # movement at the left edge, outside the face area
+    assert gate.still(frame)
+    frame[110:130, 150:170] = 255
+    assert not gate.still(frame)
+
+    gate.reset()
+    assert gate.roi is None and not gate.still(_frame())
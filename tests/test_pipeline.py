@@ -0,0 +1,49 @@
+import queue
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from main import CapturePipeline, put_latest
+
+class SlowCamera:
+    """ read() blocks until allowed to return; records which thread released it """
+    def __init__(self):
+        self.reading = threading.Event()
+        self.proceed = threading.Event()
+        self.released_by = None
+        self.in_read = False
+
+    def read(self):
+        self.in_read = True
+        self.reading.set()
+        self.proceed.wait(5.0)
+        self.in_read = False
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def release(self):
+        assert not self.in_read, "released during read()"
+        self.released_by = threading.current_thread()
+
+def test_camera_released_by_the_capture_thread():
+    camera = SlowCamera()
+    detector = SimpleNamespace(cap=camera, running=True)
+    pipeline = CapturePipeline(detector, dispatcher=None)
+    pipeline.start()
+    capture_thread = pipeline.threads[0]
+    assert camera.reading.wait(2.0)
+
+    detector.running = False
+    for t in pipeline.threads:
+        t.join(timeout=0.1)  # like stop() timing out while read() still runs
+    assert camera.released_by is None
+
+    camera.proceed.set()
+    capture_thread.join(2.0)
+    assert camera.released_by is capture_thread
+
+def test_put_latest_keeps_only_the_newest():
+    slot = queue.Queue(maxsize=1)
+    assert not put_latest(slot, 1)
+    assert put_latest(slot, 2)  # 1 dropped
+    assert slot.get_nowait() == 2
@@ -0,0 +1,55 @@
+import numpy as np
+
+from main import BLENDSHAPE_NAMES, FrameFeatures, Point
+from recording import TraceReader, TraceRecorder, format_clock, parse_clock
+
+def _features(n):
+    blend = np.full(len(BLENDSHAPE_NAMES), n / 100, dtype=np.float32)
+    hands = [(Point(0.25, 0.5), Point(0.75, 0.125))] if n % 2 else []
+    return FrameFeatures(blend, 0.375, 0.5, Point(0.5, 0.875), hands)
+
+def _record(path, frames, block_rows):
+    recorder = TraceRecorder(path, BLENDSHAPE_NAMES, block_rows=block_rows)
+    for n in range(frames):
+        recorder.append(10.0 + n / 30, None if n % 5 == 4 else _features(n))
+    recorder.close()
+
+def test_round_trip_single_block(tmp_path):
+    path = str(tmp_path / "one.vtrace")
+    _record(path, 7, block_rows=16)
+    reader = TraceReader(path)
+    assert len(reader) == 7 and len(reader.blocks) == 1
+    assert np.array_equal(reader.times, 10.0 + np.arange(7) / 30)
+    assert reader.column("present").tolist() == [1, 1, 1, 1, 0, 1, 1]
+    assert reader.column(BLENDSHAPE_NAMES[0])[3] == np.float32(0.03)
+    assert np.isnan(reader.column(BLENDSHAPE_NAMES[0])[4])
+    assert reader.column("chin_y")[0] == np.float32(0.875)
+    assert reader.column("hand0_index_y")[1] == np.float32(0.125)
+    assert np.isnan(reader.column("hand0_index_y")[2])
+
+def test_round_trip_blocks(tmp_path):
+    path = str(tmp_path / "many.vtrace")
+    _record(path, 50, block_rows=16)
+    reader = TraceReader(path)
+    assert len(reader) == 50 and len(reader.blocks) == 4
+    present = reader.column("present")
+    assert present is reader.column("present")  # loaded once
+    assert present.tolist() == [0.0 if n % 5 == 4 else 1.0 for n in range(50)]
+
+    views = reader.block_views()
+    assert [len(times) for times, _ in views] == [16, 16, 16, 2]
+    assert np.array_equal(np.concatenate([times for times, _ in views]), reader.times)
+    i = reader.index["left_eye_y"]
+    assert np.array_equal(np.concatenate([data[i] for _, data in views]), reader.column("left_eye_y"), equal_nan=True)
+
+def test_truncated_tail_is_dropped(tmp_path):
+    path = tmp_path / "cut.vtrace"
+    _record(str(path), 40, block_rows=16)
+    path.write_bytes(path.read_bytes()[:-100])
+    reader = TraceReader(str(path))
+    assert len(reader) == 32
+
+def test_clock():
+    assert parse_clock("1:02:03") == 3723
+    assert parse_clock("42:10") == 2530
+    assert format_clock(2530.5) == "42:10.500"
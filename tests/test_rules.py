@@ -0,0 +1,68 @@
+""" The scalar backend (live decisions) must agree with the vectorized one (replay, tuning) """
+import json
+
+import numpy as np
+import pytest
+
+from main import RULE_INPUTS, default_config, load_config_file
+from rules import SCORE_LIMIT, RuleSet, rules_spec
+
+def _compare(ruleset, rows):
+    scalar = np.array([[float(v) for v in ruleset.evaluate(row.tolist())] for row in rows]).T
+    vector = ruleset.evaluate_columns(list(rows.T), len(rows))
+    assert np.allclose(scalar, vector, rtol=1e-9, atol=1e-12)
+    return scalar
+
+def test_default_rules_agree():
+    ruleset = RuleSet(rules_spec(default_config()), RULE_INPUTS)
+    rows = np.random.default_rng(0).random((200, len(RULE_INPUTS)))
+    rows[::3, -1] = np.inf
+    _compare(ruleset, rows)
+
+def test_degenerate_expressions_agree():
+    spec = {"rules": {
+        "DIV": {"expr": "a / b"},
+        "POW": {"expr": "10.0 ** (a * 1000)"},
+        "NAN": {"expr": "max(sqrt(a - 1), 0.5)"},
+        "NEG": {"expr": "min(-a / b, 2 ** b)"},
+    }}
+    ruleset = RuleSet(spec, ["a", "b"])
+    rows = np.array([[0.0, 0.0], [1.0, 0.0], [0.5, 0.25], [2.0, 1.0], [0.0, np.inf]])
+    scores = _compare(ruleset, rows)
+    assert np.isfinite(scores).all() and np.abs(scores).max() <= SCORE_LIMIT
+    assert scores[ruleset.index["POW"]][1] == SCORE_LIMIT
+    assert scores[ruleset.index["NAN"]][0] == 0.0
+
+def test_self_test():
+    ruleset = RuleSet({"rules": {"A": {"expr": "1.0 / a + a ** 900.0"}}}, ["a"])
+    ruleset.self_test()
+
+    def broken(v):
+        raise OverflowError("math range error")
+    ruleset.evaluate = broken
+    with pytest.raises(ValueError):
+        ruleset.self_test()
+
+def test_invalid_specs():
+    with pytest.raises(ValueError):
+        RuleSet({"rules": {"A": {"expr": "x", "suppressed_by": ["B"]}, "B": {"expr": "x", "suppressed_by": ["A"]}}}, ["x"])
+    with pytest.raises(ValueError):
+        RuleSet({"rules": {"A": {"expr": "unknown_name"}}}, ["x"])
+
+@pytest.mark.parametrize("rules", [
+    {"SMILE2": {"suppressed_by": []}},
+    {"SMILE2": "jawOpen"},
+    {"SMILE2": {"expr": "jawOpen", "suppressed_by": "SMILE"}},
+    ["SMILE"],
+])
+def test_bad_rules_only_replace_the_rules(tmp_path, rules):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"keys": {"SMILE": "f1"}, "thresholds": {"SMILE": 0.9}, "rules": rules}))
+    config = load_config_file(str(path))
+    assert config["keys"]["SMILE"] == "f1" and config["thresholds"]["SMILE"] == 0.9
+    assert config["rules"] == default_config()["rules"]
+
+def test_unreadable_config_gives_defaults(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("{not json")
+    assert load_config_file(str(path)) == default_config()
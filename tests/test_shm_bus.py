@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+from main import BLENDSHAPE_NAMES, FrameFeatures, Point, publish_result
+from shm_bus import FRAME_HEADER, VERSION, BusPublisher, BusReader, _create, _FrameRing
+
+@pytest.fixture
+def name():
+    return f"vtest{os.getpid()}"
+
+def test_round_trip(name):
+    publisher = BusPublisher(name, ["SMILE", "SAD"])
+    reader = BusReader(name)
+    try:
+        assert reader.frame() is None and reader.state() is None
+        frame = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+        features = FrameFeatures(np.full(len(BLENDSHAPE_NAMES), 0.25, dtype=np.float32), 0.375, 0.5,
+                                 Point(0.5, 0.875), [(Point(0.25, 0.5), Point(0.75, 0.125))])
+        publisher.publish(frame, "SMILE", features, scores=[0.75, 0.125])
+
+        assert np.array_equal(reader.frame(), frame)
+        assert reader.frame() is None  # nothing new
+        assert reader.frame_info()[0] == 1
+        state = reader.state()
+        assert state["action"] == "SMILE" and state["scores"] == {"SMILE": 0.75, "SAD": 0.125}
+        assert state["chin"] == (0.5, 0.875) and state["hand_tips"] == [[[0.25, 0.5], [0.75, 0.125]]]
+        assert reader.state() is None
+
+        # A new frame size replaces the frames segment; the reader follows
+        publisher.publish(np.zeros((2, 3), dtype=np.uint8), "NEUTRAL")
+        assert reader.frame().shape == (2, 3)
+        assert reader.state() is None  # captured only, no result
+    finally:
+        reader.close()
+        publisher.close()
+    assert BusReader(name).frame() is None
+
+def test_incomplete_header_is_skipped(name):
+    shm = _create(f"{name}_frames", _FrameRing.size((4, 6, 3)))
+    header = np.ndarray((), dtype=FRAME_HEADER, buffer=shm.buf)
+    reader = BusReader(name)
+    try:
+        assert reader.frame() is None and reader.ring is None
+        header["version"], header["live"] = VERSION, 1
+        header["height"], header["width"], header["channels"] = 4, 6, 3
+        assert reader.frame() is None and reader.ring is None  # no magic yet
+        header["magic"] = b"VEADOFRM"
+        reader.frame()
+        assert reader.ring is not None and reader.ring.shape == (4, 6, 3)
+    finally:
+        reader.close()
+        del header
+        shm.close()
+        shm.unlink()
+
+def test_frames_segment_created_up_front(name):
+    publisher = BusPublisher(name, ["SMILE"], shape=(4, 6, 3))
+    reader = BusReader(name)
+    try:
+        assert reader.frame() is None and reader.ring.shape == (4, 6, 3)
+    finally:
+        reader.close()
+        publisher.close()
+
+def test_failing_bus_is_closed_not_raised(name, monkeypatch):
+    publisher = BusPublisher(name, ["SMILE"])
+    def exists(shape):
+        raise FileExistsError(f"{name}_frames")
+    monkeypatch.setattr(publisher, "_open_ring", exists)
+    assert not publish_result(publisher, np.zeros((4, 6, 3), dtype=np.uint8), "SMILE")
+    assert publisher.state is None
@@ -0,0 +1,61 @@
+""" StableScoreBank must reproduce StableScore, and batched trace replay frame-by-frame replay """
+import numpy as np
+
+from main import BLENDSHAPE_NAMES, FrameFeatures, Point, StableScore, StableScoreBank, default_config
+from recording import TraceRecorder, replay
+
+WINDOWS = {"A": 4, "B": 5, "C": 6}
+HIGH, LOW = 0.55, 0.40
+
+def _reference(values, mask):
+    reference = {name: StableScore(window_size=w) for name, w in WINDOWS.items()}
+    states = np.zeros(values.shape, dtype=bool)
+    smoothed = np.full(values.shape, np.nan)
+    for n in range(len(values)):
+        for i, name in enumerate(WINDOWS):
+            if mask[n, i]:
+                states[n, i], smoothed[n, i] = reference[name].update(values[n, i], HIGH, LOW)
+    return states, smoothed
+
+def _inputs(frames=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((frames, len(WINDOWS))), rng.random((frames, len(WINDOWS))) > 0.2
+
+def test_update_matches_stable_score():
+    values, mask = _inputs()
+    expected, expected_sm = _reference(values, mask)
+    bank = StableScoreBank(WINDOWS)
+    for n in range(len(values)):
+        for i, name in enumerate(WINDOWS):
+            if mask[n, i]:
+                state, smoothed = bank.update(name, values[n, i], HIGH, LOW)
+                assert state == expected[n, i], f"frame {n} {name}"
+                assert abs(smoothed - expected_sm[n, i]) <= 1e-9, f"frame {n} {name}"
+
+def test_update_batch_matches_stable_score():
+    values, mask = _inputs()
+    expected, expected_sm = _reference(values, mask)
+    states, smoothed = StableScoreBank(WINDOWS).update_batch(values, HIGH, LOW, mask)
+    assert np.array_equal(states, expected & mask)
+    assert np.allclose(smoothed[mask], expected_sm[mask], atol=1e-9)
+
+def test_batch_replay_matches_per_frame(tmp_path):
+    # Landmarks are float32 like MediaPipe output, so both paths see identical inputs
+    rng = np.random.default_rng(1)
+    path = str(tmp_path / "check.vtrace")
+    recorder = TraceRecorder(path, BLENDSHAPE_NAMES)
+    for n in range(6000):
+        features = None
+        if n % 97:
+            hands = [(Point(*rng.random(2, dtype=np.float32)), Point(*rng.random(2, dtype=np.float32)))] if n % 300 > 150 else []
+            features = FrameFeatures(rng.random(len(BLENDSHAPE_NAMES), dtype=np.float32) * (n % 200 > 60),
+                                     float(np.float32(0.4)), float(np.float32(0.4 + 0.1 * (n % 400 > 300))),
+                                     Point(float(np.float32(0.5)), float(np.float32(0.8))), hands)
+        recorder.append(1000 + n / 30, features)
+    recorder.close()
+
+    config = default_config()
+    per_frame = replay(path, config, per_frame=True)
+    batch = replay(path, config)
+    assert batch["transitions"] > 0
+    assert per_frame["timeline"] == batch["timeline"]